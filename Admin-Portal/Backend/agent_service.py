@@ -0,0 +1,238 @@
+"""
+Agent Service
+CRUD operations on agents, backed by MongoDB with the Redis cache in front
+"""
+import hashlib
+import re
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+import orjson
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models import AgentCreate, AgentUpdate
+from cache import (
+    ALL_AGENTS_KEY,
+    agent_id_key,
+    agent_name_key,
+    get_cached,
+    set_cached,
+    invalidate,
+    publish_agent_change,
+)
+
+# 24 hex characters; checked before constructing an ObjectId so it is parsed once
+is_object_id = re.compile(r"[0-9a-fA-F]{24}").fullmatch
+
+
+# (unix second, UTC datetime for that second) of the last utcnow_cached call
+_last_ts: Tuple[int, datetime] = (0, datetime.fromtimestamp(0, timezone.utc))
+
+
+def utcnow_cached() -> datetime:
+    """
+    Current UTC time at one-second resolution; the timezone-aware datetime
+    is only built once per second and returned as-is within it
+    """
+    global _last_ts
+    sec = int(time.time())
+    if sec != _last_ts[0]:
+        _last_ts = (sec, datetime.fromtimestamp(sec, timezone.utc))
+    return _last_ts[1]
+
+
+def agent_helper(agent) -> dict:
+    """Convert MongoDB document to dict with string _id"""
+    if agent:
+        agent["_id"] = str(agent["_id"])
+        return agent
+    return None
+
+
+def agent_etag(agent: dict) -> str:
+    """
+    Return the agent's ETag: the _etag version tag stored on every write,
+    or a content hash for documents written before tags were stored
+    """
+    etag = agent.get("_etag")
+    if etag is None:
+        etag = hashlib.blake2b(orjson.dumps(agent, default=str, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+    return etag
+
+
+# Default projection for responses that bypass the Agent model: internal
+# fields such as the _etag version tag are not part of the API
+PUBLIC_PROJECTION = {"_etag": 0}
+
+
+def parse_agent_id(agent_id: str) -> ObjectId:
+    """Parse an agent ID, raising 400 if it is not a valid ObjectId"""
+    if not is_object_id(agent_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid agent ID format"
+        )
+    return ObjectId(agent_id)
+
+
+class AgentService:
+    """Owns the agents collection and keeps the cache consistent with it"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get_all(self, projection: Optional[dict] = None) -> List[dict]:
+        """Get all agents; full documents are served from the cache"""
+        if projection:
+            return [agent_helper(agent) async for agent in self.collection.find({}, projection).batch_size(200)]
+
+        cached = await get_cached(ALL_AGENTS_KEY)
+        if cached is not None:
+            return cached
+
+        agents = [agent_helper(agent) async for agent in self.collection.find().batch_size(200)]
+        await set_cached(ALL_AGENTS_KEY, agents)
+        return agents
+
+    async def get_page(self, skip: int, limit: int, projection: Optional[dict] = None) -> dict:
+        """Get one page of agents plus the total count in a single aggregate round trip"""
+        items_pipeline = [
+            {"$sort": {"_id": 1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": projection or PUBLIC_PROJECTION},
+        ]
+        pipeline = [{"$facet": {"items": items_pipeline, "total": [{"$count": "n"}]}}]
+
+        result = (await self.collection.aggregate(pipeline).to_list(1))[0]
+        return {
+            "items": [agent_helper(agent) for agent in result["items"]],
+            "total": result["total"][0]["n"] if result["total"] else 0,
+        }
+
+    async def stream_all(self, projection: Optional[dict] = None) -> AsyncIterator[bytes]:
+        """Yield agents as NDJSON lines as the cursor produces them"""
+        async for agent in self.collection.find({}, projection or PUBLIC_PROJECTION).batch_size(200):
+            yield orjson.dumps(agent_helper(agent)) + b"\n"
+
+    async def get(self, agent_id: str) -> dict:
+        """Get a single agent by ID"""
+        oid = parse_agent_id(agent_id)
+
+        cached = await get_cached(agent_id_key(agent_id))
+        if cached is not None:
+            return cached
+
+        agent = await self.collection.find_one({"_id": oid})
+        if not agent:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Agent with ID {agent_id} not found"
+            )
+
+        agent = agent_helper(agent)
+        await set_cached(agent_id_key(agent_id), agent)
+        return agent
+
+    async def get_by_name(self, agent_name: str) -> dict:
+        """Get a single agent by name"""
+        cached = await get_cached(agent_name_key(agent_name))
+        if cached is not None:
+            return cached
+
+        agent = await self.collection.find_one({"name": agent_name})
+        if not agent:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Agent with name '{agent_name}' not found"
+            )
+
+        agent = agent_helper(agent)
+        await set_cached(agent_name_key(agent_name), agent)
+        return agent
+
+    async def create(self, agent: AgentCreate) -> dict:
+        """Create a new agent"""
+        agent_dict = agent.model_dump()
+        agent_dict["created_at"] = utcnow_cached()
+        agent_dict["_etag"] = secrets.token_hex(16)
+
+        # Insert agent (the unique index on name rejects duplicates).
+        # insert_one sets _id on agent_dict, so no re-read is needed.
+        try:
+            await self.collection.insert_one(agent_dict)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Agent with name '{agent.name}' already exists"
+            )
+        await invalidate(ALL_AGENTS_KEY)
+        await publish_agent_change(agent.name)
+        return agent_helper(agent_dict)
+
+    async def update(self, agent_id: str, agent_update: AgentUpdate) -> dict:
+        """Update an existing agent"""
+        oid = parse_agent_id(agent_id)
+
+        # Prepare update data (only include fields that are provided)
+        update_data = agent_update.model_dump(exclude_none=True, exclude_unset=True)
+
+        if not update_data:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No fields to update"
+            )
+        update_data["_etag"] = secrets.token_hex(16)
+
+        # Update agent in a single round trip (the unique index on name rejects
+        # conflicting renames). The previous document is returned so the old
+        # name can be evicted from the cache; the update is a plain $set, so
+        # the updated document is the previous one merged with update_data.
+        try:
+            existing = await self.collection.find_one_and_update(
+                {"_id": oid},
+                {"$set": update_data},
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Agent with name '{update_data['name']}' already exists"
+            )
+        if existing is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Agent with ID {agent_id} not found"
+            )
+
+        updated_agent = {**existing, **update_data}
+        await invalidate(
+            ALL_AGENTS_KEY,
+            agent_id_key(agent_id),
+            agent_name_key(existing["name"]),
+            agent_name_key(updated_agent["name"]),
+        )
+        await publish_agent_change(existing["name"], updated_agent["name"])
+        return agent_helper(updated_agent)
+
+    async def delete(self, agent_id: str) -> None:
+        """Delete an agent"""
+        oid = parse_agent_id(agent_id)
+
+        deleted = await self.collection.find_one_and_delete(
+            {"_id": oid},
+            projection={"name": 1}
+        )
+        if deleted is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Agent with ID {agent_id} not found"
+            )
+
+        await invalidate(ALL_AGENTS_KEY, agent_id_key(agent_id), agent_name_key(deleted["name"]))
+        await publish_agent_change(deleted["name"])
@@ -0,0 +1,91 @@
+"""
+Redis cache for agent documents
+Caching is disabled when REDIS_URL is not set
+"""
+import os
+from typing import Any, Optional
+
+import orjson
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+# Redis connection configuration
+REDIS_URL = os.environ.get("REDIS_URL", "")
+AGENT_CACHE_TTL = int(os.environ.get("AGENT_CACHE_TTL", 300))
+
+ALL_AGENTS_KEY = "agents:all"
+
+# Admin writes publish the affected agent names here so User Portal workers
+# can evict their in-process copies
+AGENT_EVENTS_CHANNEL = "agents:invalidate"
+
+pool: Optional[ConnectionPool] = None
+redis: Optional[Redis] = None
+
+
+def agent_id_key(agent_id: str) -> str:
+    return f"agents:id:{agent_id}"
+
+
+def agent_name_key(agent_name: str) -> str:
+    return f"agents:name:{agent_name}"
+
+
+def init_cache() -> None:
+    """Create the Redis connection pool for this worker process"""
+    global pool, redis
+    if REDIS_URL:
+        pool = ConnectionPool.from_url(REDIS_URL, max_connections=20)
+        redis = Redis(connection_pool=pool)
+
+
+async def close_cache() -> None:
+    """Close the Redis connection pool"""
+    global pool, redis
+    if redis is not None:
+        await redis.aclose()
+        await pool.disconnect()
+    pool = None
+    redis = None
+
+
+async def get_cached(key: str) -> Any:
+    """Return the cached value for key, or None on a miss"""
+    if redis is None:
+        return None
+    try:
+        data = await redis.get(key)
+    except RedisError:
+        return None
+    return orjson.loads(data) if data is not None else None
+
+
+async def set_cached(key: str, value: Any) -> None:
+    """Store value under key with the agent cache TTL"""
+    if redis is None:
+        return
+    try:
+        await redis.setex(key, AGENT_CACHE_TTL, orjson.dumps(value, default=str))
+    except RedisError:
+        pass
+
+
+async def invalidate(*keys: str) -> None:
+    """Remove keys from the cache"""
+    if redis is None or not keys:
+        return
+    try:
+        await redis.delete(*keys)
+    except RedisError:
+        pass
+
+
+async def publish_agent_change(*agent_names: str) -> None:
+    """Notify subscribers that these agents were created, updated or deleted"""
+    if redis is None:
+        return
+    try:
+        for agent_name in agent_names:
+            await redis.publish(AGENT_EVENTS_CHANNEL, agent_name)
+    except RedisError:
+        pass
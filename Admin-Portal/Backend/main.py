@@ -1,10 +1,14 @@
-from fastapi import FastAPI, HTTPException, status, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response, status, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.security import APIKeyHeader
 from typing import List, Optional
-from datetime import datetime, timezone
-from bson import ObjectId
+import hmac
+import logging
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -13,15 +17,73 @@ from pydantic import BaseModel
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-from database import collection
-from models import Agent, AgentCreate, AgentUpdate
+from database import client, collection
+from models import Agent, AgentCreate, AgentList, AgentUpdate
+from cache import init_cache, close_cache
+from agent_service import AgentService, agent_etag
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Manage the MongoDB client and Redis cache for the lifetime of the worker process"""
+    await collection.create_index("name", unique=True)
+    init_cache()
+    yield
+    await close_cache()
+    client.close()
+
 
 app = FastAPI(
     title="LLM Agents Admin API",
     description="API for managing LLM agents",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
+class UnhandledErrorMiddleware:
+    """
+    Turn any unhandled error into a 500 response (HTTPExceptions are handled
+    by FastAPI). Added before CORSMiddleware so it runs inside it and the
+    500 still carries CORS headers; exception handlers for Exception run
+    outside all middleware, where the browser would only see a network error.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            # Too late to replace a response that is already being sent
+            if response_started:
+                raise
+            logger.exception("Unhandled error on %s", scope["path"])
+            response = ORJSONResponse(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content={"detail": f"Internal error: {str(exc)}"}
+            )
+            await response(scope, receive, send)
+
+
+app.add_middleware(UnhandledErrorMiddleware)
+
+
 # CORS configuration
 # Get CORS origins from environment variable, default includes localhost and production frontend
 cors_origins_env = os.environ.get("CORS_ORIGINS", "")
@@ -43,11 +105,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger responses (agent lists embed long prompts)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Password authentication
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD")
 if not ADMIN_PASSWORD:
     raise ValueError("ADMIN_PASSWORD environment variable is required. Please set it in .env file.")
-security = HTTPBearer()
+# Read the raw Authorization header; avoids building credential models per request
+security = APIKeyHeader(name="Authorization", auto_error=True)
 
 # Authentication models
 class LoginRequest(BaseModel):
@@ -65,17 +131,42 @@ def verify_password(password: str) -> bool:
     """Verify the admin password"""
     return password == ADMIN_PASSWORD
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> bool:
+@lru_cache(maxsize=1024)
+def is_valid_token(token: str) -> bool:
+    """Constant-time token comparison, memoized per token string"""
+    return hmac.compare_digest(token.encode(), VALID_TOKEN.encode())
+
+def verify_token(authorization: str = Depends(security)) -> bool:
     """Verify the authentication token"""
-    return credentials.credentials == VALID_TOKEN
+    return is_valid_token(authorization.removeprefix("Bearer "))
+
+
+agent_service = AgentService(collection)
+
+
+def get_agent_service() -> AgentService:
+    """Dependency returning the process-wide agent service"""
+    return agent_service
 
 
-def agent_helper(agent) -> dict:
-    """Convert MongoDB document to dict with string _id"""
-    if agent:
-        agent["_id"] = str(agent["_id"])
-        return agent
-    return None
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return f'"{etag}"' in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def conditional_agent_response(agent: dict, request: Request, response: Response):
+    """Return 304 if the client's copy is current, otherwise tag the 200 response"""
+    etag = agent_etag(agent)
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": f'"{etag}"'})
+    response.headers["ETag"] = f'"{etag}"'
+    response.headers["Cache-Control"] = "private, max-age=30"
+    return agent
 
 
 @app.get("/")
@@ -104,192 +195,96 @@ async def verify_auth(is_authenticated: bool = Depends(verify_token)):
 
 
 @app.get("/api/agents", response_model=List[Agent], status_code=status.HTTP_200_OK)
-async def get_all_agents(is_authenticated: bool = Depends(verify_token)):
-    """Get all agents from the database"""
-    try:
-        agents = []
-        for agent in collection.find():
-            agents.append(agent_helper(agent))
-        return agents
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error fetching agents: {str(e)}"
-        )
+async def get_all_agents(
+    request: Request,
+    fields: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    is_authenticated: bool = Depends(verify_token),
+    service: AgentService = Depends(get_agent_service),
+):
+    """
+    Get all agents from the database
+
+    Pass a comma-separated `fields` list (e.g. `name,endpoint,created_at`) to
+    fetch only those fields instead of the full agent documents.
+    Send `Accept: application/x-ndjson` to stream one agent per line.
+    Pass `limit` (and optionally `skip`) to get one page as `{"items": [...], "total": n}`.
+    """
+    projection = None
+    if fields:
+        projection = {f.strip(): 1 for f in fields.split(",") if f.strip()} | {"_id": 1}
+
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(service.stream_all(projection), media_type="application/x-ndjson")
+
+    if limit is not None:
+        return ORJSONResponse(await service.get_page(skip, limit, projection))
+
+    if projection:
+        # Partial documents don't match the Agent model, so bypass it
+        return ORJSONResponse(await service.get_all(projection))
+
+    # Validate and encode to JSON bytes in one pass through the prebuilt adapter
+    agents = AgentList.validate_python(await service.get_all())
+    return Response(AgentList.dump_json(agents, by_alias=True), media_type="application/json")
 
 
 @app.get("/api/agents/{agent_id}", response_model=Agent, status_code=status.HTTP_200_OK)
-async def get_agent(agent_id: str, is_authenticated: bool = Depends(verify_token)):
-    """Get a single agent by ID"""
-    try:
-        if not ObjectId.is_valid(agent_id):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid agent ID format"
-            )
-        
-        agent = collection.find_one({"_id": ObjectId(agent_id)})
-        if not agent:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Agent with ID {agent_id} not found"
-            )
-        
-        return agent_helper(agent)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error fetching agent: {str(e)}"
-        )
+async def get_agent(
+    agent_id: str,
+    request: Request,
+    response: Response,
+    is_authenticated: bool = Depends(verify_token),
+    service: AgentService = Depends(get_agent_service),
+):
+    """Get a single agent by ID (supports If-None-Match)"""
+    return conditional_agent_response(await service.get(agent_id), request, response)
 
 
 @app.get("/api/agents/name/{agent_name}", response_model=Agent, status_code=status.HTTP_200_OK)
-async def get_agent_by_name(agent_name: str, is_authenticated: bool = Depends(verify_token)):
-    """Get a single agent by name"""
-    try:
-        agent = collection.find_one({"name": agent_name})
-        if not agent:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Agent with name '{agent_name}' not found"
-            )
-        
-        return agent_helper(agent)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error fetching agent: {str(e)}"
-        )
+async def get_agent_by_name(
+    agent_name: str,
+    request: Request,
+    response: Response,
+    is_authenticated: bool = Depends(verify_token),
+    service: AgentService = Depends(get_agent_service),
+):
+    """Get a single agent by name (supports If-None-Match)"""
+    return conditional_agent_response(await service.get_by_name(agent_name), request, response)
 
 
 @app.post("/api/agents", response_model=Agent, status_code=status.HTTP_201_CREATED)
-async def create_agent(agent: AgentCreate, is_authenticated: bool = Depends(verify_token)):
+async def create_agent(agent: AgentCreate, is_authenticated: bool = Depends(verify_token), service: AgentService = Depends(get_agent_service)):
     """Create a new agent"""
-    try:
-        # Check if agent with same name already exists
-        existing = collection.find_one({"name": agent.name})
-        if existing:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Agent with name '{agent.name}' already exists"
-            )
-        
-        # Prepare agent data
-        agent_dict = agent.model_dump()
-        agent_dict["created_at"] = datetime.now(timezone.utc)
-        
-        # Insert agent
-        result = collection.insert_one(agent_dict)
-        
-        # Fetch and return the created agent
-        created_agent = collection.find_one({"_id": result.inserted_id})
-        return agent_helper(created_agent)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error creating agent: {str(e)}"
-        )
+    return await service.create(agent)
 
 
 @app.put("/api/agents/{agent_id}", response_model=Agent, status_code=status.HTTP_200_OK)
-async def update_agent(agent_id: str, agent_update: AgentUpdate, is_authenticated: bool = Depends(verify_token)):
+async def update_agent(agent_id: str, agent_update: AgentUpdate, is_authenticated: bool = Depends(verify_token), service: AgentService = Depends(get_agent_service)):
     """Update an existing agent"""
-    try:
-        if not ObjectId.is_valid(agent_id):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid agent ID format"
-            )
-        
-        # Check if agent exists
-        existing = collection.find_one({"_id": ObjectId(agent_id)})
-        if not existing:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Agent with ID {agent_id} not found"
-            )
-        
-        # Prepare update data (only include fields that are provided)
-        update_data = {k: v for k, v in agent_update.model_dump().items() if v is not None}
-        
-        if not update_data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No fields to update"
-            )
-        
-        # If name is being updated, check for conflicts
-        if "name" in update_data and update_data["name"] != existing["name"]:
-            name_conflict = collection.find_one({"name": update_data["name"]})
-            if name_conflict:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Agent with name '{update_data['name']}' already exists"
-                )
-        
-        # Update agent
-        collection.update_one(
-            {"_id": ObjectId(agent_id)},
-            {"$set": update_data}
-        )
-        
-        # Fetch and return updated agent
-        updated_agent = collection.find_one({"_id": ObjectId(agent_id)})
-        return agent_helper(updated_agent)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error updating agent: {str(e)}"
-        )
+    return await service.update(agent_id, agent_update)
 
 
 @app.delete("/api/agents/{agent_id}", status_code=status.HTTP_200_OK)
-async def delete_agent(agent_id: str, is_authenticated: bool = Depends(verify_token)):
+async def delete_agent(agent_id: str, is_authenticated: bool = Depends(verify_token), service: AgentService = Depends(get_agent_service)):
     """Delete an agent"""
-    try:
-        if not ObjectId.is_valid(agent_id):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid agent ID format"
-            )
-        
-        # Check if agent exists
-        existing = collection.find_one({"_id": ObjectId(agent_id)})
-        if not existing:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Agent with ID {agent_id} not found"
-            )
-        
-        # Delete agent
-        result = collection.delete_one({"_id": ObjectId(agent_id)})
-        
-        if result.deleted_count == 1:
-            return {"message": f"Agent with ID {agent_id} deleted successfully"}
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to delete agent"
-            )
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error deleting agent: {str(e)}"
-        )
+    await service.delete(agent_id)
+    return {"message": f"Agent with ID {agent_id} deleted successfully"}
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("BACKEND_PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.environ.get("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    # "auto" selects uvloop and httptools when installed (uvicorn[standard])
+    uvicorn.run(
+        "main:app",
+        app_dir=str(Path(__file__).parent),
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="auto",
+        http="auto",
+    )
 
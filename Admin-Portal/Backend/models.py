@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any
-from pydantic import BaseModel, Field, ConfigDict
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
 
 
 class AgentBase(BaseModel):
@@ -34,6 +34,7 @@ class Agent(AgentBase):
     model_config = ConfigDict(
         populate_by_name=True,
         from_attributes=True,
+        validate_assignment=False,
         json_schema_extra={
             "example": {
                 "_id": "507f1f77bcf86cd799439011",
@@ -53,3 +54,6 @@ class Agent(AgentBase):
         }
     )
 
+
+# Prebuilt validator/serializer for agent list responses
+AgentList = TypeAdapter(List[Agent])
@@ -2,271 +2,703 @@
 API Executor Module
 Handles execution of queries against external APIs
 """
+import asyncio
+import functools
+import hashlib
 import httpx
-from typing import Dict, Any
+from cachetools import TTLCache
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 from database import collection
+from cache import agent_name_key, get_cached, get_cached_many, set_cached, set_cached_many
+from query_batcher import QueryBatcher
 import logging
-import json
-from datetime import datetime
-from urllib.parse import quote, urlencode
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+import orjson
+import os
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlsplit
+
+__all__ = [
+    "init_http_client",
+    "close_http_client",
+    "get_http_client",
+    "invalidate_agent",
+    "api_kind",
+    "get_agent_by_name",
+    "get_agents_by_names",
+    "execute_query",
+    "execute_agent_query",
+    "batch_execute_query",
+]
+
 logger = logging.getLogger(__name__)
 
+# Log section separators
+_EQ80 = "=" * 80
+_DASH80 = "-" * 80
+
+# Endpoint classification: OData services live under /OData/ or /odata/
+_ODATA_RE = re.compile(r"/odata/", re.I)
+
+
+class EndpointInfo(NamedTuple):
+    base_url: str  # endpoint without trailing slashes
+    is_odata: bool
+    host: str
+    url: httpx.URL  # parsed once; query parameters are merged into a copy
+
+
+@functools.lru_cache(maxsize=512)
+def _endpoint_info(endpoint: str) -> EndpointInfo:
+    """Parse and classify an agent endpoint; endpoints rarely change, so this is cached"""
+    return EndpointInfo(
+        base_url=endpoint.rstrip("/"),
+        is_odata=_ODATA_RE.search(endpoint) is not None,
+        host=urlsplit(endpoint).netloc,
+        url=httpx.URL(endpoint),
+    )
+
+# OData value encoders, bound once. Letters, digits and "_.-~" are never
+# escaped by quote(), so operators like "and"/"eq" need no entry in safe.
+_quote_filter = functools.partial(quote, safe="'(),")
+_quote_select = functools.partial(quote, safe=",")
+_quote_orderby = functools.partial(quote, safe=" ,")
+_quote_expand = functools.partial(quote, safe=",/")
+
+# Shared HTTP client, created once per worker process in the app lifespan so
+# connections to agent endpoints are pooled and kept alive across requests
+_client: Optional[httpx.AsyncClient] = None
+
+_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+_HEADERS = {
+    "Accept": "application/json",
+    "User-Agent": "LLM-Agents/1.0"
+}
+
+
+def init_http_client() -> None:
+    """Create the shared HTTP client"""
+    global _client
+    _client = httpx.AsyncClient(
+        timeout=30.0,
+        follow_redirects=True,
+        limits=_LIMITS,
+        http2=True,
+        headers=_HEADERS,
+    )
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it if the lifespan has not run"""
+    if _client is None:
+        init_http_client()
+    return _client
+
+
+# In-process agent cache in front of Redis/Mongo, shared with the query
+# generator and response processor; entries are evicted early when the Admin
+# API publishes a change for the agent
+_agent_cache: TTLCache = TTLCache(maxsize=512, ttl=300)
+
+# Agent loads in progress, keyed by name, so concurrent misses for the same
+# agent share one Redis/MongoDB lookup without waiting on other agents
+_agent_loads: Dict[str, asyncio.Task] = {}
+
+
+def invalidate_agent(agent_name: str) -> None:
+    """Drop an agent from the in-process cache"""
+    _agent_cache.pop(agent_name, None)
+
+
+# Successful GET results keyed by a hash of the bound URL. Each entry holds
+# the raw body, when it stops being fresh (per the agent's cache_ttl) and the
+# ETag/Last-Modified validators used to revalidate it once it is stale.
+# Entries are dropped after RESPONSE_CACHE_MAX_AGE seconds regardless, and
+# the cache is bounded by the total size of the stored bodies.
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64_000_000))
+RESPONSE_CACHE_MAX_AGE = int(os.environ.get("RESPONSE_CACHE_MAX_AGE", 600))
+
+_response_cache: TTLCache = TTLCache(
+    maxsize=RESPONSE_CACHE_MAX_BYTES,
+    ttl=RESPONSE_CACHE_MAX_AGE,
+    getsizeof=lambda entry: len(entry["body"]),
+)
+
+
+def response_cache_key(url: str) -> str:
+    return hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+
+
+def store_response(cache_key: str, cache_ttl: int, body: bytes, response: Optional[httpx.Response] = None) -> None:
+    """Cache a successful raw body along with the response's validators, if any"""
+    if len(body) > RESPONSE_CACHE_MAX_BYTES:
+        return
+    headers = response.headers if response is not None else {}
+    _response_cache[cache_key] = {
+        "body": bytes(body),
+        "expires": time.monotonic() + cache_ttl,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+    }
+
+
+def refresh_response(cache_key: str, cache_ttl: int, entry: Dict[str, Any]) -> Any:
+    """Mark a revalidated (304) entry fresh again and return its decoded body"""
+    entry["expires"] = time.monotonic() + cache_ttl
+    # Re-inserted so the entry's max age also restarts
+    _response_cache[cache_key] = entry
+    return orjson.loads(entry["body"])
+
+
+def conditional_headers(entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+    """If-None-Match/If-Modified-Since headers for revalidating a cached response"""
+    if entry is None:
+        return None
+    headers = {}
+    if entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers or None
+
+
+# One micro-batcher per (agent_name, _etag) for agents with supports_batch, so
+# an edited agent gets a batcher built from its new configuration
+_batchers: Dict[Tuple[str, Optional[str]], QueryBatcher] = {}
+
+
+# Request headers for batch POSTs (the client already sends Accept: application/json)
+_JSON_CONTENT = {"Content-Type": "application/json"}
+
+
+def get_batcher(agent: Dict[str, Any]) -> QueryBatcher:
+    """Return the micro-batcher for a batch-capable agent"""
+    key = (agent["name"], agent.get("_etag"))
+    batcher = _batchers.get(key)
+    if batcher is None:
+        # Drop batchers built from earlier versions of this agent
+        for stale in [k for k in _batchers if k[0] == agent["name"]]:
+            del _batchers[stale]
+        endpoint = agent["endpoint"]
+        max_bytes = agent.get("max_response_bytes")
+        semaphore = host_semaphore(_endpoint_info(endpoint).host, agent.get("max_concurrency", 16))
+
+        async def send(queries: List[Dict[str, Any]]) -> Any:
+            # Same host limit, 429 retries and size limit as single queries
+            response, body = await fetch_throttled(
+                get_http_client(),
+                endpoint,
+                max_bytes,
+                _JSON_CONTENT,
+                semaphore,
+                method="POST",
+                content=orjson.dumps({"batch": queries}),
+            )
+            if response.status_code >= 400:
+                error_text = body[:500].decode(errors="replace")
+                raise Exception(f"Batch API returned status {response.status_code}. Error: {error_text}")
+            return orjson.loads(body)
+
+        batcher = QueryBatcher(
+            send,
+            endpoint,
+            max_batch_size=agent.get("batch_max_size", 16),
+            max_wait_ms=agent.get("batch_max_wait_ms", 50),
+        )
+        _batchers[key] = batcher
+    return batcher
+
+
+# Concurrent requests per endpoint host, so bursts queue here instead of
+# tripping the remote API's rate limits
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+# Retries of a 429 response before it is returned to the caller
+_MAX_429_RETRIES = 3
+_MAX_RETRY_AFTER = 30.0
+
+
+def host_semaphore(host: str, max_concurrency: int) -> asyncio.Semaphore:
+    """Return the semaphore bounding concurrent requests to host"""
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_concurrency)
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+
+def retry_after_seconds(value: Optional[str], attempt: int) -> float:
+    """Delay before retrying a 429: the Retry-After header, else exponential backoff"""
+    delay = 0.5 * 2 ** attempt
+    if value:
+        if value.isdigit():
+            delay = float(value)
+        else:
+            try:
+                delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                pass
+    return min(max(delay, 0.0), _MAX_RETRY_AFTER)
+
+
+async def fetch_limited(
+    client: httpx.AsyncClient,
+    url,
+    max_bytes: Optional[int],
+    headers: Optional[Dict[str, str]] = None,
+    method: str = "GET",
+    content: Optional[bytes] = None
+) -> Tuple[httpx.Response, bytes]:
+    """
+    Request url (GET unless method is given), streaming the body into a
+    buffer of at most max_bytes; None reads the body without a limit
+
+    Returns the (closed) response, for its status and headers, and the body
+    """
+    async with client.stream(method, url, headers=headers, content=content) as response:
+        if max_bytes is None:
+            return response, await response.aread()
+        content_length = response.headers.get("Content-Length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            raise Exception(f"Response too large: {content_length} bytes (limit {max_bytes})")
+        body = bytearray()
+        async for chunk in response.aiter_bytes(65536):
+            body.extend(chunk)
+            if len(body) > max_bytes:
+                raise Exception(f"Response too large: over {max_bytes} bytes")
+    return response, body
+
+
+async def fetch_throttled(
+    client: httpx.AsyncClient,
+    url,
+    max_bytes: Optional[int],
+    headers: Optional[Dict[str, str]],
+    semaphore: asyncio.Semaphore,
+    method: str = "GET",
+    content: Optional[bytes] = None
+) -> Tuple[httpx.Response, bytes]:
+    """fetch_limited under the host's concurrency limit, retrying 429 responses"""
+    for attempt in range(_MAX_429_RETRIES + 1):
+        async with semaphore:
+            response, body = await fetch_limited(client, url, max_bytes, headers, method, content)
+        if response.status_code != 429 or attempt == _MAX_429_RETRIES:
+            return response, body
+        delay = retry_after_seconds(response.headers.get("Retry-After"), attempt)
+        logger.warning("API returned 429 Too Many Requests, retrying in %.1fs", delay)
+        await asyncio.sleep(delay)
+
+
+def api_kind(agent: Dict[str, Any]) -> str:
+    """
+    Classify the agent's API for query generation: "odata" for endpoints
+    under /OData/, "elasticsearch" when the example query has a query
+    object, otherwise "rest"
+    """
+    if "/OData/" in agent["endpoint"]:
+        return "odata"
+    example_query = agent.get("example_query") or {}
+    if isinstance(example_query.get("query"), dict):
+        return "elasticsearch"
+    return "rest"
+
+
+def cache_agent(agent: Dict[str, Any]) -> None:
+    """Store a loaded agent in the in-process cache, classified once here"""
+    agent["_api_kind"] = api_kind(agent)
+    _agent_cache[agent["name"]] = agent
+
+
+async def get_agent_by_name(agent_name: str) -> Dict[str, Any]:
+    """Retrieve agent configuration from cache or database"""
+    agent = _agent_cache.get(agent_name)
+    if agent is not None:
+        return agent
+
+    task = _agent_loads.get(agent_name)
+    if task is None:
+        task = asyncio.ensure_future(_load_agent(agent_name))
+        _agent_loads[agent_name] = task
+        task.add_done_callback(lambda _: _agent_loads.pop(agent_name, None))
+    # Shielded so one caller disconnecting does not cancel the load for the others
+    return await asyncio.shield(task)
+
+
+async def _load_agent(agent_name: str) -> Dict[str, Any]:
+    """Load an agent from Redis, else MongoDB, into the in-process cache"""
+    agent = await get_cached(agent_name_key(agent_name))
+    if agent is None:
+        agent = await collection.find_one({"name": agent_name})
+        if not agent:
+            raise ValueError(f"Agent '{agent_name}' not found")
+        agent["_id"] = str(agent["_id"])
+        await set_cached(agent_name_key(agent_name), agent)
+
+    cache_agent(agent)
+    return agent
+
+
+async def get_agents_by_names(agent_names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Retrieve several agents' configurations at once: cached agents are used
+    as-is, agents already being loaded are joined, and the rest are loaded
+    together (one Redis MGET, then one MongoDB query for what Redis lacks)
+
+    Returns a dict of name to agent; names that do not exist are left out
+    """
+    agents: Dict[str, Any] = {}
+    pending: Dict[str, asyncio.Task] = {}
+    missing = []
+    for agent_name in dict.fromkeys(agent_names):
+        agent = _agent_cache.get(agent_name)
+        if agent is not None:
+            agents[agent_name] = agent
+        elif agent_name in _agent_loads:
+            pending[agent_name] = _agent_loads[agent_name]
+        else:
+            missing.append(agent_name)
+
+    if missing:
+        batch = asyncio.ensure_future(_load_agents(missing))
+        for agent_name in missing:
+            # Registered per name so concurrent get_agent_by_name calls join this load
+            task = asyncio.ensure_future(_loaded_agent(batch, agent_name))
+            _agent_loads[agent_name] = task
+            task.add_done_callback(lambda _, agent_name=agent_name: _agent_loads.pop(agent_name, None))
+            pending[agent_name] = task
+
+    if pending:
+        results = await asyncio.gather(*(asyncio.shield(task) for task in pending.values()), return_exceptions=True)
+        for agent_name, result in zip(pending, results):
+            if isinstance(result, ValueError):
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            agents[agent_name] = result
+
+    return agents
+
+
+async def _load_agents(agent_names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Load several agents from Redis, else MongoDB, into the in-process cache"""
+    agents: Dict[str, Any] = {}
+    cached = await get_cached_many([agent_name_key(agent_name) for agent_name in agent_names])
+    for agent_name, agent in zip(agent_names, cached):
+        if agent is not None:
+            agents[agent_name] = agent
+
+    uncached = [agent_name for agent_name in agent_names if agent_name not in agents]
+    if uncached:
+        loaded = {}
+        async for agent in collection.find({"name": {"$in": uncached}}):
+            agent["_id"] = str(agent["_id"])
+            loaded[agent_name_key(agent["name"])] = agent
+            agents[agent["name"]] = agent
+        await set_cached_many(loaded)
 
-def get_agent_by_name(agent_name: str) -> Dict[str, Any]:
-    """Retrieve agent configuration from database"""
-    agent = collection.find_one({"name": agent_name})
-    if not agent:
+    for agent in agents.values():
+        cache_agent(agent)
+    return agents
+
+
+async def _loaded_agent(batch: "asyncio.Future[Dict[str, Dict[str, Any]]]", agent_name: str) -> Dict[str, Any]:
+    """One agent from a multi-agent load, raising ValueError if it does not exist"""
+    agent = (await batch).get(agent_name)
+    if agent is None:
         raise ValueError(f"Agent '{agent_name}' not found")
     return agent
 
 
-async def execute_query(agent_name: str, query: Dict[str, Any]) -> Dict[str, Any]:
+async def batch_execute_query(items: List[Tuple[str, Dict[str, Any]]], use_cache: bool = True) -> List[Any]:
+    """
+    Execute several queries concurrently
+    
+    Args:
+        items: (agent_name, query) pairs
+        use_cache: Serve cached responses for URLs that have one
+        
+    Returns:
+        One entry per item, in order: the API response data, or the
+        exception raised for that item
+    """
+    agents = await get_agents_by_names([agent_name for agent_name, _ in items])
+
+    async def run(agent_name: str, query: Dict[str, Any]) -> Dict[str, Any]:
+        agent = agents.get(agent_name)
+        if agent is None:
+            raise ValueError(f"Agent '{agent_name}' not found")
+        return await execute_agent_query(agent, query, use_cache)
+
+    return await asyncio.gather(*(run(agent_name, query) for agent_name, query in items), return_exceptions=True)
+
+
+async def execute_query(agent_name: str, query: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
     """
     Execute a query against the agent's endpoint
     
     Args:
         agent_name: Name of the agent
         query: Query dictionary to send to the endpoint
+        use_cache: Serve a cached response for the same URL if one is fresh
         
     Returns:
         API response data
     """
-    logger.info("=" * 80)
-    logger.info(f"API EXECUTION STARTED - Agent: {agent_name}")
-    logger.info(f"Timestamp: {datetime.now().isoformat()}")
-    logger.info("-" * 80)
+    agent = await get_agent_by_name(agent_name)
+    return await execute_agent_query(agent, query, use_cache)
+
+
+async def execute_agent_query(agent: Dict[str, Any], query: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+    """Execute a query against an already resolved agent's endpoint"""
+    logger.info(_EQ80)
+    logger.info("API EXECUTION STARTED - Agent: %s", agent['name'])
+    logger.info(_DASH80)
     
-    # Get agent configuration
-    agent = get_agent_by_name(agent_name)
     endpoint = agent["endpoint"]
+    endpoint_info = _endpoint_info(endpoint)
+    # Seconds to cache successful GET responses; 0 disables caching for the agent
+    cache_ttl = agent.get("cache_ttl", 60)
+    # Largest response body read from the agent's API; unlimited unless set
+    max_bytes = agent.get("max_response_bytes")
+    semaphore = host_semaphore(endpoint_info.host, agent.get("max_concurrency", 16))
     
-    logger.info(f"Endpoint: {endpoint}")
-    logger.info("-" * 80)
-    logger.info("QUERY BEING SENT TO API:")
-    logger.info(json.dumps(query, indent=2, ensure_ascii=False))
-    logger.info("-" * 80)
+    logger.info("Endpoint: %s", endpoint)
+    logger.info(_DASH80)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("QUERY BEING SENT TO API: %s", orjson.dumps(query, option=orjson.OPT_INDENT_2).decode())
+        logger.debug(_DASH80)
     
     # Detect endpoint type based on URL and query structure
     # OData detection: look for /OData/ or /odata/ (case-insensitive)
-    is_odata = "/odata/" in endpoint.lower()
-    has_odata_structure = "entity_set" in query or "$filter" in str(query) or "filter" in query
+    is_odata = endpoint_info.is_odata
+    has_odata_structure = "entity_set" in query or "filter" in query or "$filter" in query
     
     try:
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            # ALWAYS use GET requests - convert query to URL parameters
-            # OData has special handling for $ parameters
-            if is_odata or has_odata_structure:
-                try:
-                    logger.info("Attempting OData-style GET request")
-                    
-                    # Build OData query URL
-                    # Get entity_set from query, or use 'type' field as fallback
-                    entity_set = query.get("entity_set") or query.get("type")
-                    
-                    if not entity_set:
-                        raise ValueError("OData query must include 'entity_set' or 'type' field to specify the entity to query")
-                    
-                    # Normalize endpoint URL - remove trailing slashes
-                    base_url = endpoint.rstrip("/")
-                    
-                    # Build OData query URL with entity set
-                    entity_url = f"{base_url}/{entity_set}"
-                    
-                    # Build OData query parameters
-                    # OData uses $ prefix which should NOT be encoded in the parameter names
-                    # We'll build the query string manually to preserve $ signs
-                    odata_parts = []
-                    
-                    # Handle $filter parameter
-                    if "filter" in query:
-                        filter_value = query['filter']
-                        # Encode the filter value - preserve OData operators and syntax
-                        # OData operators: and, or, not, ge, le, gt, lt, eq, ne, contains, startswith, endswith
-                        # Keep parentheses, quotes, commas, and operators unencoded
-                        # Spaces and special characters will be encoded
-                        filter_value = quote(filter_value, safe="'(),andorgelegtlteqnecontainsstartswithendswith")
-                        odata_parts.append(f"$filter={filter_value}")
-                    
-                    # Handle $top parameter (limit results)
-                    if "top" in query:
-                        odata_parts.append(f"$top={query['top']}")
-                    elif "size" in query:  # Allow 'size' as alias for $top
-                        odata_parts.append(f"$top={query['size']}")
-                    
-                    # Handle $skip parameter (pagination)
-                    if "skip" in query:
-                        odata_parts.append(f"$skip={query['skip']}")
-                    elif "from" in query:  # Allow 'from' as alias for $skip
-                        odata_parts.append(f"$skip={query['from']}")
-                    
-                    # Handle $select parameter (field selection)
-                    if "select" in query:
-                        # Select fields - encode but preserve commas
-                        select_value = quote(query['select'], safe=",")
-                        odata_parts.append(f"$select={select_value}")
-                    
-                    # Handle $orderby parameter (sorting)
-                    if "orderby" in query:
-                        # Orderby - encode but preserve spaces and desc/asc keywords
-                        orderby_value = quote(query['orderby'], safe=" ,desasc")
-                        odata_parts.append(f"$orderby={orderby_value}")
-                    
-                    # Handle $expand parameter (related entities)
-                    if "expand" in query:
-                        expand_value = quote(query['expand'], safe=",/")
-                        odata_parts.append(f"$expand={expand_value}")
-                    
-                    # Build full URL - manually construct to preserve $ in parameter names
-                    if odata_parts:
-                        query_string = "&".join(odata_parts)
-                        full_url = f"{entity_url}?{query_string}"
-                    else:
-                        full_url = entity_url
-                    
-                    logger.info(f"Request URL: {full_url}")
-                    logger.info(f"Request Method: GET")
-                    logger.info(f"OData Parameters: {query_string if odata_parts else 'None'}")
-                    
-                    # Use the raw URL string directly
-                    # httpx.request() with a full URL string should preserve the query string as-is
-                    # But we need to ensure httpx doesn't re-encode it
-                    # The issue is that httpx.URL() might encode $ signs, so we'll use the string directly
-                    response = await client.get(
-                        full_url,
-                        headers={
-                            "Accept": "application/json",
-                            "User-Agent": "LLM-Agents/1.0"
-                        },
-                        follow_redirects=True
-                    )
-                    
-                    logger.info(f"API Response Status: {response.status_code}")
-                    
-                    # If successful, return results
-                    if response.status_code == 200:
-                        response.raise_for_status()
-                        api_results = response.json()
-                        logger.info("-" * 80)
-                        logger.info("API RESPONSE RECEIVED (OData GET):")
-                        response_str = json.dumps(api_results, indent=2, ensure_ascii=False)
-                        if len(response_str) > 1000:
-                            logger.info(response_str[:1000] + f"\n... (truncated, total length: {len(response_str)} chars)")
-                        else:
-                            logger.info(response_str)
-                        logger.info("=" * 80)
-                        return api_results
-                    elif response.status_code == 400:
-                        # 400 Bad Request - query format issue
-                        error_text = response.text[:500] if hasattr(response, 'text') else "No error details"
-                        logger.error(f"OData GET returned 400 Bad Request")
-                        logger.error(f"Error details: {error_text}")
-                        logger.error(f"Attempted URL: {full_url}")
-                        # Don't fallback for 400 - it means the query format is wrong
-                        raise Exception(f"OData API returned 400 Bad Request. The query format may be incorrect. Error: {error_text}")
-                    elif response.status_code == 404:
-                        # 404 Not Found - entity set or endpoint doesn't exist
-                        error_text = response.text[:500] if hasattr(response, 'text') else "No error details"
-                        logger.error(f"OData GET returned 404 Not Found")
-                        logger.error(f"Error details: {error_text}")
-                        logger.error(f"Attempted URL: {full_url}")
-                        raise Exception(f"OData endpoint or entity set not found (404). Check entity_set name. Error: {error_text}")
-                    else:
-                        # Other status codes - raise error (no fallback)
-                        error_text = response.text[:500] if hasattr(response, 'text') else "No error details"
-                        logger.error(f"OData GET returned status {response.status_code}")
-                        logger.error(f"Error details: {error_text}")
-                        raise Exception(f"OData API returned status {response.status_code}. Error: {error_text}")
-                        
-                except ValueError as e:
-                    # Re-raise ValueError (missing entity_set)
-                    logger.error(f"OData query configuration error: {str(e)}")
-                    raise
-                except httpx.HTTPStatusError as e:
-                    # Handle HTTP errors - no fallback, just raise
-                    error_text = e.response.text[:500] if hasattr(e.response, 'text') else "No error details"
-                    logger.error(f"OData GET HTTP error: Status {e.response.status_code}")
-                    logger.error(f"Error details: {error_text}")
-                    raise Exception(f"OData API request failed with status {e.response.status_code}. Error: {error_text}")
-                except httpx.RequestError as e:
-                    # Network/connection errors - raise without fallback
-                    logger.error(f"OData GET request error: {str(e)}")
-                    raise Exception(f"OData API connection error: {str(e)}")
-            
-            # ALWAYS use GET requests - convert query to URL parameters
-            logger.info("Using GET request with URL parameters (standard REST API)")
-            logger.info(f"Request URL: {endpoint}")
-            logger.info(f"Request Method: GET")
-            
-            # Convert query dict to URL parameters
-            get_url = endpoint
-            if query:
-                params = []
-                for key, value in query.items():
-                    if isinstance(value, (str, int, float, bool)):
-                        # Simple values - URL encode
-                        params.append(f"{key}={quote(str(value))}")
-                    elif isinstance(value, dict):
-                        # Nested dicts - JSON encode and URL encode
-                        params.append(f"{key}={quote(json.dumps(value))}")
-                    elif isinstance(value, list):
-                        # Arrays - repeat parameter for each item
-                        for item in value:
-                            if isinstance(item, (str, int, float, bool)):
-                                params.append(f"{key}={quote(str(item))}")
-                            else:
-                                params.append(f"{key}={quote(json.dumps(item))}")
-                    elif value is None:
-                        # Skip None values
-                        continue
-                
-                if params:
-                    query_string = "&".join(params)
-                    get_url = f"{endpoint}?{query_string}"
-                    logger.info(f"Query Parameters: {query_string[:200]}...")
-            
-            logger.info(f"Full Request URL: {get_url}")
-            
-            response = await client.get(
-                get_url,
-                headers={
-                    "Accept": "application/json",
-                    "User-Agent": "LLM-Agents/1.0"
-                }
-            )
-            
-            logger.info(f"API Response Status: {response.status_code}")
-            logger.info(f"Response Headers: {dict(response.headers)}")
-            
-            response.raise_for_status()
-            api_results = response.json()
-            
-            logger.info("-" * 80)
-            logger.info("API RESPONSE RECEIVED:")
-            # Log first 1000 chars of response to avoid huge logs
-            response_str = json.dumps(api_results, indent=2, ensure_ascii=False)
-            if len(response_str) > 1000:
-                logger.info(response_str[:1000] + f"\n... (truncated, total length: {len(response_str)} chars)")
-            else:
-                logger.info(response_str)
-            logger.info("=" * 80)
-            
+        # Agents whose API accepts {"batch": [...]} share one request per batch window
+        if agent.get("supports_batch"):
+            # Results are cached per query, keyed by the endpoint and the canonical query
+            cache_key = response_cache_key(f"{endpoint}#{orjson.dumps(query, option=orjson.OPT_SORT_KEYS).decode()}")
+            entry = _response_cache.get(cache_key)
+            if use_cache and entry is not None and entry["expires"] > time.monotonic():
+                logger.info("Returning cached API response")
+                return orjson.loads(entry["body"])
+            logger.info("Submitting query to batch queue")
+            api_results = await get_batcher(agent).submit(query)
+            if cache_ttl > 0:
+                store_response(cache_key, cache_ttl, orjson.dumps(api_results))
             return api_results
-    except httpx.HTTPStatusError as e:
-        logger.error(f"API HTTP Error: Status {e.response.status_code}")
-        logger.error(f"Response Text: {e.response.text}")
-        raise Exception(f"API request failed with status {e.response.status_code}: {e.response.text}")
+        
+        client = get_http_client()
+        # ALWAYS use GET requests - convert query to URL parameters
+        # OData has special handling for $ parameters
+        if is_odata or has_odata_structure:
+            try:
+                logger.info("Attempting OData-style GET request")
+                
+                # Build OData query URL
+                # Get entity_set from query, or use 'type' field as fallback
+                entity_set = query.get("entity_set") or query.get("type")
+                
+                if not entity_set:
+                    raise ValueError("OData query must include 'entity_set' or 'type' field to specify the entity to query")
+                
+                # Normalized endpoint URL - trailing slashes removed
+                base_url = endpoint_info.base_url
+                
+                # Build OData query URL with entity set
+                entity_url = f"{base_url}/{entity_set}"
+                
+                # Build OData query parameters
+                # OData uses $ prefix which should NOT be encoded in the parameter names
+                # We'll build the query string manually to preserve $ signs
+                odata_parts = []
+                
+                # Handle $filter parameter
+                filter_value = query.get("filter")
+                if filter_value is not None:
+                    # Encode the filter value - keep parentheses, quotes and commas unencoded
+                    # Spaces and special characters will be encoded
+                    odata_parts.append(f"$filter={_quote_filter(filter_value)}")
+                
+                # Handle $top parameter (limit results); 'size' is an alias
+                top = query.get("top")
+                if top is None:
+                    top = query.get("size")
+                if top is not None:
+                    odata_parts.append(f"$top={top}")
+                
+                # Handle $skip parameter (pagination); 'from' is an alias
+                skip = query.get("skip")
+                if skip is None:
+                    skip = query.get("from")
+                if skip is not None:
+                    odata_parts.append(f"$skip={skip}")
+                
+                # Handle $select parameter (field selection)
+                select_value = query.get("select")
+                if select_value is not None:
+                    # Select fields - encode but preserve commas
+                    odata_parts.append(f"$select={_quote_select(select_value)}")
+                
+                # Handle $orderby parameter (sorting)
+                orderby_value = query.get("orderby")
+                if orderby_value is not None:
+                    # Orderby - encode but preserve spaces and commas
+                    odata_parts.append(f"$orderby={_quote_orderby(orderby_value)}")
+                
+                # Handle $expand parameter (related entities)
+                expand_value = query.get("expand")
+                if expand_value is not None:
+                    odata_parts.append(f"$expand={_quote_expand(expand_value)}")
+                
+                # Build full URL - manually construct to preserve $ in parameter names
+                if odata_parts:
+                    query_string = "&".join(odata_parts)
+                    full_url = f"{entity_url}?{query_string}"
+                else:
+                    full_url = entity_url
+                
+                logger.info("Request URL: %s", full_url)
+                logger.info("Request Method: GET")
+                logger.info("OData Parameters: %s", query_string if odata_parts else 'None')
+                
+                cache_key = response_cache_key(full_url)
+                entry = _response_cache.get(cache_key)
+                if use_cache and entry is not None and entry["expires"] > time.monotonic():
+                    logger.info("Returning cached API response")
+                    # Decoded per hit, so callers never share (or mutate) a cached object
+                    return orjson.loads(entry["body"])
+                
+                # Use the raw URL string directly
+                # httpx.request() with a full URL string should preserve the query string as-is
+                # But we need to ensure httpx doesn't re-encode it
+                # The issue is that httpx.URL() might encode $ signs, so we'll use the string directly
+                response, body = await fetch_throttled(client, full_url, max_bytes, conditional_headers(entry), semaphore)
+                
+                logger.info("API Response Status: %s", response.status_code)
+                logger.debug("HTTP Version: %s", response.http_version)
+                
+                # Stale cached body confirmed unchanged by the server
+                if response.status_code == 304 and entry is not None:
+                    logger.info("API response cache revalidated")
+                    return refresh_response(cache_key, cache_ttl, entry)
+                
+                # If successful, return results
+                if response.status_code == 200:
+                    api_results = orjson.loads(body)
+                    if cache_ttl > 0:
+                        store_response(cache_key, cache_ttl, body, response)
+                    logger.info(_DASH80)
+                    logger.info("API RESPONSE RECEIVED (OData GET): %s bytes", len(body))
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Response (first 1000 bytes): %s", body[:1000].decode(errors="replace"))
+                    logger.info(_EQ80)
+                    return api_results
+                elif response.status_code == 400:
+                    # 400 Bad Request - query format issue
+                    error_text = body[:500].decode(errors="replace") or "No error details"
+                    logger.error("OData GET returned 400 Bad Request")
+                    logger.error("Error details: %s", error_text)
+                    logger.error("Attempted URL: %s", full_url)
+                    # Don't fallback for 400 - it means the query format is wrong
+                    raise Exception(f"OData API returned 400 Bad Request. The query format may be incorrect. Error: {error_text}")
+                elif response.status_code == 404:
+                    # 404 Not Found - entity set or endpoint doesn't exist
+                    error_text = body[:500].decode(errors="replace") or "No error details"
+                    logger.error("OData GET returned 404 Not Found")
+                    logger.error("Error details: %s", error_text)
+                    logger.error("Attempted URL: %s", full_url)
+                    raise Exception(f"OData endpoint or entity set not found (404). Check entity_set name. Error: {error_text}")
+                else:
+                    # Other status codes - raise error (no fallback)
+                    error_text = body[:500].decode(errors="replace") or "No error details"
+                    logger.error("OData GET returned status %s", response.status_code)
+                    logger.error("Error details: %s", error_text)
+                    raise Exception(f"OData API returned status {response.status_code}. Error: {error_text}")
+                    
+            except ValueError as e:
+                # Re-raise ValueError (missing entity_set)
+                logger.error("OData query configuration error: %s", e)
+                raise
+            except httpx.RequestError as e:
+                # Network/connection errors - raise without fallback
+                logger.error("OData GET request error: %s", e)
+                raise Exception(f"OData API connection error: {str(e)}")
+        
+        # ALWAYS use GET requests - convert query to URL parameters
+        logger.info("Using GET request with URL parameters (standard REST API)")
+        logger.info("Request URL: %s", endpoint)
+        logger.info("Request Method: GET")
+        
+        # Convert query dict to (key, value) pairs; httpx encodes them in one pass
+        params = []
+        for key, value in (query or {}).items():
+            if value is None:
+                # Skip None values
+                continue
+            # Arrays - repeat parameter for each item
+            for item in (value if isinstance(value, list) else (value,)):
+                if isinstance(item, (str, int, float, bool)):
+                    params.append((key, str(item)))
+                else:
+                    # Nested values - compact JSON
+                    params.append((key, orjson.dumps(item).decode()))
+        
+        get_url = endpoint_info.url.copy_merge_params(params)
+        if params:
+            logger.info("Query Parameters: %s...", get_url.query.decode()[:200])
+        
+        logger.info("Full Request URL: %s", get_url)
+        
+        cache_key = response_cache_key(str(get_url))
+        entry = _response_cache.get(cache_key)
+        if use_cache and entry is not None and entry["expires"] > time.monotonic():
+            logger.info("Returning cached API response")
+            return orjson.loads(entry["body"])
+        
+        response, body = await fetch_throttled(client, get_url, max_bytes, conditional_headers(entry), semaphore)
+        
+        logger.info("API Response Status: %s", response.status_code)
+        logger.debug("HTTP Version: %s", response.http_version)
+        logger.info("Response Headers: %s", response.headers)
+        
+        # Stale cached body confirmed unchanged by the server
+        if response.status_code == 304 and entry is not None:
+            logger.info("API response cache revalidated")
+            return refresh_response(cache_key, cache_ttl, entry)
+        
+        if response.status_code >= 400:
+            error_text = body.decode(errors="replace")
+            logger.error("API HTTP Error: Status %s", response.status_code)
+            logger.error("Response Text: %s", error_text)
+            raise Exception(f"API request failed with status {response.status_code}: {error_text}")
+        api_results = orjson.loads(body)
+        if cache_ttl > 0:
+            store_response(cache_key, cache_ttl, body, response)
+        
+        logger.info(_DASH80)
+        logger.info("API RESPONSE RECEIVED: %s bytes", len(body))
+        # Log first 1000 chars of the raw body instead of re-serializing the results
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response (first 1000 bytes): %s", body[:1000].decode(errors="replace"))
+        logger.info(_EQ80)
+        
+        return api_results
     except httpx.TimeoutException:
         logger.error("API request timed out after 30 seconds")
         raise Exception("API request timed out")
     except Exception as e:
-        logger.error(f"Error executing API query: {str(e)}")
+        logger.error("Error executing API query: %s", e)
         raise Exception(f"Error executing API query: {str(e)}")
 
 
@@ -0,0 +1,109 @@
+"""
+Redis cache for agent documents
+This service reads entries (filling misses) and listens for changes; the
+Admin API invalidates entries when agents change
+Caching is disabled when REDIS_URL is not set
+"""
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import orjson
+from redis.asyncio import ConnectionPool, Redis
+from redis.exceptions import RedisError
+
+# Redis connection configuration
+REDIS_URL = os.environ.get("REDIS_URL", "")
+AGENT_CACHE_TTL = int(os.environ.get("AGENT_CACHE_TTL", 300))
+
+# Admin writes publish the affected agent names here so User Portal workers
+# can evict their in-process copies
+AGENT_EVENTS_CHANNEL = "agents:invalidate"
+
+pool: Optional[ConnectionPool] = None
+redis: Optional[Redis] = None
+
+
+def agent_name_key(agent_name: str) -> str:
+    return f"agents:name:{agent_name}"
+
+
+def init_cache() -> None:
+    """Create the Redis connection pool for this worker process"""
+    global pool, redis
+    if REDIS_URL:
+        pool = ConnectionPool.from_url(REDIS_URL, max_connections=20)
+        redis = Redis(connection_pool=pool)
+
+
+async def close_cache() -> None:
+    """Close the Redis connection pool"""
+    global pool, redis
+    if redis is not None:
+        await redis.aclose()
+        await pool.disconnect()
+    pool = None
+    redis = None
+
+
+async def get_cached(key: str) -> Any:
+    """Return the cached value for key, or None on a miss"""
+    if redis is None:
+        return None
+    try:
+        data = await redis.get(key)
+    except RedisError:
+        return None
+    return orjson.loads(data) if data is not None else None
+
+
+async def set_cached(key: str, value: Any) -> None:
+    """Store value under key with the agent cache TTL"""
+    if redis is None:
+        return
+    try:
+        await redis.setex(key, AGENT_CACHE_TTL, orjson.dumps(value, default=str))
+    except RedisError:
+        pass
+
+
+async def get_cached_many(keys: List[str]) -> List[Any]:
+    """Return the cached values for keys in one round trip, None for each miss"""
+    if redis is None or not keys:
+        return [None] * len(keys)
+    try:
+        values = await redis.mget(keys)
+    except RedisError:
+        return [None] * len(keys)
+    return [orjson.loads(data) if data is not None else None for data in values]
+
+
+async def set_cached_many(items: Dict[str, Any]) -> None:
+    """Store several values with the agent cache TTL in one round trip"""
+    if redis is None or not items:
+        return
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.setex(key, AGENT_CACHE_TTL, orjson.dumps(value, default=str))
+            await pipe.execute()
+    except RedisError:
+        pass
+
+
+async def listen_for_agent_changes(on_change: Callable[[str], None]) -> None:
+    """Call on_change(agent_name) for every agent change published by the Admin API"""
+    if redis is None:
+        return
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(AGENT_EVENTS_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    on_change(message["data"].decode())
+        except RedisError:
+            # Reconnect after a short pause; entries still expire via TTL meanwhile
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
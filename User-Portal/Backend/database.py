@@ -1,5 +1,5 @@
 import os
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.server_api import ServerApi
 
 # MongoDB connection configuration
@@ -10,13 +10,22 @@ MONGO_HOST = os.environ.get("MONGO_HOST", "chatapi.yzflq8h.mongodb.net")
 
 uri = f"mongodb+srv://{MONGO_USER}:{MONGO_PASS}@{MONGO_HOST}/?appName={MONGO_APP}&retryWrites=true&w=majority"
 
-client = MongoClient(
+# Size the pool to the expected in-flight queries per worker; the server must
+# allow at least workers * MONGO_MAX_POOL_SIZE connections
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 5))
+
+client = AsyncIOMotorClient(
     uri,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    compressors="zstd,zlib",
+    zlibCompressionLevel=3,
     server_api=ServerApi("1"),
     tls=True,
     tlsAllowInvalidCertificates=False,
     connectTimeoutMS=30000,
-    serverSelectionTimeoutMS=30000,
+    serverSelectionTimeoutMS=3000,
 )
 
 db = client["LLM_Agents"]
@@ -0,0 +1,48 @@
+"""
+Logging configuration
+Records are queued on the calling thread and written to stderr by a
+background thread, so log I/O never blocks the event loop
+"""
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Root log level; INFO logs the request workflow, DEBUG adds prompt and payload dumps
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+
+listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL) -> None:
+    """
+    Route root logger output through a queue to a background writer; safe
+    to call repeatedly, and a no-op if the process already configured the
+    root logger (e.g. a gunicorn or uvicorn log config)
+    """
+    global listener
+    if listener is not None or logging.getLogger().handlers:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the background writer"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
@@ -2,26 +2,82 @@
 User Portal Backend API
 Handles user interactions with agents
 """
-from fastapi import FastAPI, HTTPException, status
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
-from bson import ObjectId
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from typing import Any, AsyncIterator, Optional, Tuple
+from pathlib import Path
 import os
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from database import collection
+from database import client, collection
+from cache import init_cache, close_cache, listen_for_agent_changes
+from log_config import configure_logging, stop_logging
+from openai_client import close_openai_clients
 from models import QueryGenerationRequest, QueryGenerationResponse, OpenAIRequest, OpenAIResponse
 from query_generator import generate_query
-from api_executor import execute_query
-from openai_processor import generate_final_response
+from api_executor import (
+    execute_agent_query,
+    get_agent_by_name as fetch_agent,
+    init_http_client,
+    close_http_client,
+    invalidate_agent,
+)
+from openai_processor import generate_final_response, stream_final_response
+
+# The application owns logging configuration; modules only create loggers
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Log section separator
+_EQ80 = "=" * 80
+
+
+# Serialized /api/agents and /api/agents/{name} bodies with their ETags,
+# keyed by "" for the list and by agent name otherwise
+AGENT_RESPONSE_TTL = 30
+_agent_responses: TTLCache = TTLCache(maxsize=256, ttl=AGENT_RESPONSE_TTL)
+
+
+def on_agent_change(agent_name: str) -> None:
+    """Evict an agent changed through the Admin API from every in-process cache"""
+    invalidate_agent(agent_name)
+    _agent_responses.pop(agent_name, None)
+    _agent_responses.pop("", None)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Manage the MongoDB, Redis and HTTP clients for the lifetime of the worker process"""
+    # Idempotent; lets find_one({"name": ...}) use an index seek
+    await collection.create_index("name", unique=True)
+    init_cache()
+    init_http_client()
+    listener = asyncio.create_task(listen_for_agent_changes(on_agent_change))
+    yield
+    listener.cancel()
+    await close_http_client()
+    await close_openai_clients()
+    await close_cache()
+    client.close()
+    stop_logging()
+
 
 app = FastAPI(
     title="LLM Agents User Portal API",
     description="API for users to interact with LLM agents",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS configuration
@@ -36,6 +92,55 @@ else:
         "https://llm-agents-user-frontend.vercel.app",
     ]
 
+# Largest request body accepted; /api/get-response bodies carry whole API results
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", 10_000_000))
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject request bodies larger than MAX_REQUEST_BYTES with a 413. A declared
+    Content-Length is checked up front; chunked bodies are counted as they are
+    read, and the HTTPException raised from receive is rendered by FastAPI.
+    Added before CORSMiddleware so the 413 still carries CORS headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > MAX_REQUEST_BYTES:
+                response = JSONResponse(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    content={"detail": f"Request body exceeds {MAX_REQUEST_BYTES} bytes"}
+                )
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Request body exceeds {MAX_REQUEST_BYTES} bytes"
+                    )
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+app.add_middleware(RequestSizeLimitMiddleware)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
@@ -46,6 +151,92 @@ app.add_middleware(
 )
 
 
+# Fields returned to the frontend for agent selection and lookup (_id is included by default)
+AGENT_LIST_PROJECTION = {"name": 1, "endpoint_info": 1}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return f'"{etag}"' in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def cache_agent_response(key: str, payload: Any) -> Tuple[bytes, str]:
+    """Serialize payload and store it with its ETag"""
+    body = orjson.dumps(payload)
+    cached = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+    _agent_responses[key] = cached
+    return cached
+
+
+def tagged_json_response(request: Request, cached: Tuple[bytes, str]) -> Response:
+    """Return the cached body with its ETag, or 304 when the client's copy is current"""
+    body, etag = cached
+    headers = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={AGENT_RESPONSE_TTL}"}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def wants_event_stream(request: Request) -> bool:
+    """True if the client asked for a server-sent event stream"""
+    return "text/event-stream" in request.headers.get("accept", "")
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+    """Format one server-sent event; data is JSON encoded so it stays on one line"""
+    message = f"data: {orjson.dumps(data).decode()}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+
+async def response_events(fragments: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Relay response text fragments as SSE `data` events and end with a
+    `done` event (or an `error` event)
+    """
+    try:
+        async for fragment in fragments:
+            yield sse_event(fragment)
+    except Exception as e:
+        logger.error("Error streaming final response: %s", e)
+        yield sse_event(f"Error generating response: {str(e)}", "error")
+        return
+    yield sse_event(None, "done")
+
+
+async def complete_query_events(request: QueryGenerationRequest, agent: dict, use_cache: bool) -> AsyncIterator[str]:
+    """
+    Run the complete workflow as SSE, sending each stage as soon as it
+    finishes: `query` (generated query), `results` (API results), then the
+    final response fragments
+    """
+    try:
+        generated_query = await generate_query(request.agent_name, request.user_query, agent=agent)
+        yield sse_event(generated_query, "query")
+        api_results = await execute_agent_query(agent, generated_query, use_cache=use_cache)
+        yield sse_event(api_results, "results")
+    except Exception as e:
+        logger.error("Exception in complete_query stream: %s", e)
+        yield sse_event(f"Error processing query: {str(e)}", "error")
+        return
+
+    fragments = stream_final_response(request.agent_name, request.user_query, api_results, agent=agent)
+    async for event in response_events(fragments):
+        yield event
+
+
+def event_stream_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 def agent_helper(agent) -> dict:
     """Convert MongoDB document to dict with string _id"""
     if agent:
@@ -60,20 +251,22 @@ async def root():
 
 
 @app.get("/api/agents", status_code=status.HTTP_200_OK)
-async def get_all_agents():
+async def get_all_agents(request: Request):
     """Get all available agents"""
     try:
-        agents = []
-        for agent in collection.find():
-            # Only return necessary fields for user selection
-            agent_dict = agent_helper(agent)
-            if agent_dict:
-                agents.append({
-                    "_id": agent_dict["_id"],
-                    "name": agent_dict["name"],
-                    "endpoint_info": agent_dict.get("endpoint_info", ""),
-                })
-        return agents
+        cached = _agent_responses.get("")
+        if cached is not None:
+            return tagged_json_response(request, cached)
+        # Only fetch the fields needed for user selection
+        agents = [
+            {
+                "_id": str(agent["_id"]),
+                "name": agent["name"],
+                "endpoint_info": agent.get("endpoint_info", ""),
+            }
+            async for agent in collection.find({}, AGENT_LIST_PROJECTION)
+        ]
+        return tagged_json_response(request, cache_agent_response("", agents))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -82,10 +275,13 @@ async def get_all_agents():
 
 
 @app.get("/api/agents/{agent_name}", status_code=status.HTTP_200_OK)
-async def get_agent_by_name(agent_name: str):
+async def get_agent_by_name(agent_name: str, request: Request):
     """Get agent details by name"""
     try:
-        agent = collection.find_one({"name": agent_name})
+        cached = _agent_responses.get(agent_name)
+        if cached is not None:
+            return tagged_json_response(request, cached)
+        agent = await collection.find_one({"name": agent_name}, AGENT_LIST_PROJECTION)
         if not agent:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -94,11 +290,11 @@ async def get_agent_by_name(agent_name: str):
         
         # Return only necessary fields
         agent_dict = agent_helper(agent)
-        return {
+        return tagged_json_response(request, cache_agent_response(agent_name, {
             "_id": agent_dict["_id"],
             "name": agent_dict["name"],
             "endpoint_info": agent_dict.get("endpoint_info", ""),
-        }
+        }))
     except HTTPException:
         raise
     except Exception as e:
@@ -114,7 +310,7 @@ async def generate_query_endpoint(request: QueryGenerationRequest):
     Generate an API query based on user query and agent configuration
     """
     try:
-        generated_query = generate_query(request.agent_name, request.user_query)
+        generated_query = await generate_query(request.agent_name, request.user_query)
         return QueryGenerationResponse(
             generated_query=generated_query,
             success=True,
@@ -133,15 +329,28 @@ async def generate_query_endpoint(request: QueryGenerationRequest):
 
 
 @app.post("/api/get-response", response_model=OpenAIResponse, status_code=status.HTTP_200_OK)
-async def get_openai_response(request: OpenAIRequest):
+async def get_openai_response(request: OpenAIRequest, http_request: Request):
     """
     Get final OpenAI response using user query and API results
+    Send `Accept: text/event-stream` to receive the response as server-sent
+    events while it is generated
     """
     try:
-        response = generate_final_response(
+        if wants_event_stream(http_request):
+            agent = await fetch_agent(request.agent_name)
+            return event_stream_response(response_events(stream_final_response(
+                request.agent_name,
+                request.user_query,
+                request.api_results,
+                agent=agent,
+                max_result_items=request.max_result_items
+            )))
+        
+        response = await generate_final_response(
             request.agent_name,
             request.user_query,
-            request.api_results
+            request.api_results,
+            max_result_items=request.max_result_items
         )
         return OpenAIResponse(
             response=response,
@@ -161,47 +370,53 @@ async def get_openai_response(request: OpenAIRequest):
 
 
 @app.post("/api/complete-query", status_code=status.HTTP_200_OK)
-async def complete_query(request: QueryGenerationRequest):
+async def complete_query(request: QueryGenerationRequest, http_request: Request):
     """
     Complete workflow: Generate query -> Execute API -> Get OpenAI response
     This is a convenience endpoint that combines all steps
+    Send `Cache-Control: no-cache` to skip cached API responses
+    Send `Accept: text/event-stream` to stream the workflow as server-sent
+    events (see complete_query_events)
     """
-    import logging
-    from datetime import datetime
-    
-    logger = logging.getLogger(__name__)
-    
-    logger.info("=" * 80)
-    logger.info("=" * 80)
-    logger.info(f"COMPLETE QUERY WORKFLOW STARTED")
-    logger.info(f"Agent: {request.agent_name}")
-    logger.info(f"User Query: {request.user_query}")
-    logger.info(f"Timestamp: {datetime.now().isoformat()}")
-    logger.info("=" * 80)
-    logger.info("=" * 80)
+    logger.info(_EQ80)
+    logger.info(_EQ80)
+    logger.info("COMPLETE QUERY WORKFLOW STARTED")
+    logger.info("Agent: %s", request.agent_name)
+    logger.info("User Query: %s", request.user_query)
+    logger.info(_EQ80)
+    logger.info(_EQ80)
     
     try:
+        # Look the agent up once and share it between the three steps
+        agent = await fetch_agent(request.agent_name)
+        use_cache = "no-cache" not in http_request.headers.get("cache-control", "")
+        
+        # Streamed: the response starts now and each step is sent as it completes
+        if wants_event_stream(http_request):
+            return event_stream_response(complete_query_events(request, agent, use_cache))
+        
         # Step 1: Generate query
         logger.info("\n>>> STEP 1: QUERY GENERATION <<<\n")
-        generated_query = generate_query(request.agent_name, request.user_query)
+        generated_query = await generate_query(request.agent_name, request.user_query, agent=agent)
         
         # Step 2: Execute API query
         logger.info("\n>>> STEP 2: API EXECUTION <<<\n")
-        api_results = await execute_query(request.agent_name, generated_query)
+        api_results = await execute_agent_query(agent, generated_query, use_cache=use_cache)
         
         # Step 3: Generate final response
         logger.info("\n>>> STEP 3: FINAL RESPONSE GENERATION <<<\n")
-        final_response = generate_final_response(
+        final_response = await generate_final_response(
             request.agent_name,
             request.user_query,
-            api_results
+            api_results,
+            agent=agent
         )
         
-        logger.info("=" * 80)
-        logger.info("=" * 80)
+        logger.info(_EQ80)
+        logger.info(_EQ80)
         logger.info("WORKFLOW COMPLETED SUCCESSFULLY")
-        logger.info("=" * 80)
-        logger.info("=" * 80)
+        logger.info(_EQ80)
+        logger.info(_EQ80)
         
         return {
             "response": final_response,
@@ -210,13 +425,13 @@ async def complete_query(request: QueryGenerationRequest):
             "success": True
         }
     except ValueError as e:
-        logger.error(f"ValueError: {str(e)}")
+        logger.error("ValueError: %s", e)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e)
         )
     except Exception as e:
-        logger.error(f"Exception in complete_query: {str(e)}")
+        logger.error("Exception in complete_query: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing query: {str(e)}"
@@ -226,5 +441,19 @@ async def complete_query(request: QueryGenerationRequest):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("BACKEND_PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # The workload is almost all awaiting OpenAI and agent APIs, so one
+    # event loop per core is enough
+    workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+    # "auto" selects uvloop and httptools when installed (uvicorn[standard])
+    uvicorn.run(
+        "main:app",
+        app_dir=str(Path(__file__).parent),
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="auto",
+        http="auto",
+        backlog=2048,
+        timeout_keep_alive=75,
+    )
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Dict, Any, Optional
 
 
@@ -16,7 +16,10 @@ class QueryGenerationResponse(BaseModel):
 class OpenAIRequest(BaseModel):
     agent_name: str
     user_query: str
-    api_results: Dict[str, Any]
+    # Forwarded to the model, so it is not validated field by field
+    api_results: Any
+    # Records kept from the top-level results list; defaults to MAX_RESULT_ITEMS
+    max_result_items: Optional[int] = Field(None, ge=1)
 
 
 class OpenAIResponse(BaseModel):
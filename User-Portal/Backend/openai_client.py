@@ -0,0 +1,41 @@
+"""
+OpenAI Client Module
+One AsyncOpenAI client per API key, all sharing a single HTTP/2 connection
+pool so concurrent completions are multiplexed over warm connections
+"""
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+_clients: Dict[str, AsyncOpenAI] = {}
+_http_client: Optional[httpx.AsyncClient] = None
+
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the HTTP client shared by every OpenAI client"""
+    global _http_client
+    if _http_client is None:
+        # Keeps the SDK's default timeouts; only pooling and HTTP/2 change
+        _http_client = DefaultAsyncHttpxClient(http2=True, limits=_LIMITS)
+    return _http_client
+
+
+def get_openai_client(api_key: str) -> AsyncOpenAI:
+    """Return the shared client for api_key, creating it on first use"""
+    client = _clients.get(api_key)
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, http_client=get_http_client())
+        _clients[api_key] = client
+    return client
+
+
+async def close_openai_clients() -> None:
+    """Drop the per-key clients and close their shared connection pool"""
+    global _http_client
+    _clients.clear()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -2,58 +2,68 @@
 OpenAI Processor Module
 Handles final response generation using OpenAI with API results
 """
-from openai import OpenAI
-from database import collection
-from typing import Dict, Any
-import json
+import asyncio
+import os
+from api_executor import get_agent_by_name
+from openai_client import get_openai_client
+from query_generator import prompt_cache_key
+from typing import AsyncIterator, Dict, Any, List, Optional
+import orjson
 import logging
-from datetime import datetime
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+from cachetools import LRUCache
+
 logger = logging.getLogger(__name__)
 
+# Log section separators
+_EQ80 = "=" * 80
+_DASH80 = "-" * 80
+
+__all__ = [
+    "generate_final_response",
+    "stream_final_response",
+    "build_messages",
+    "get_final_system_prompt",
+    "shrink_results",
+]
+
+# Records kept from the top-level result collection sent to the model
+MAX_RESULT_ITEMS = int(os.environ.get("MAX_RESULT_ITEMS", 20))
 
-def get_agent_by_name(agent_name: str) -> Dict[str, Any]:
-    """Retrieve agent configuration from database"""
-    agent = collection.find_one({"name": agent_name})
-    if not agent:
-        raise ValueError(f"Agent '{agent_name}' not found")
-    return agent
+# Final-response system prompts by agent version; they depend only on the agent
+_final_system_prompts: LRUCache = LRUCache(maxsize=256)
 
 
-def generate_final_response(agent_name: str, user_query: str, api_results: Dict[str, Any]) -> str:
+def truncated(items: List[Any], max_items: int) -> Any:
+    """items if it fits, otherwise the first max_items with the full and omitted counts"""
+    if len(items) <= max_items:
+        return items
+    return {"items": items[:max_items], "total": len(items), "omitted": len(items) - max_items}
+
+
+def shrink_results(value: Any, max_items: int) -> Any:
     """
-    Generate final response using OpenAI with API results
-    
-    Args:
-        agent_name: Name of the agent
-        user_query: Original user query
-        api_results: Results from the API query
-        
-    Returns:
-        Final response string
+    Cut the top-level result collection to max_items records: the results
+    themselves if they are a list, else each list-valued top-level field
+    (e.g. an OData `value` array). A cut list becomes
+    {"items": [...], "total": N, "omitted": N - max_items}; records and
+    nested values are left untouched.
     """
-    logger.info("=" * 80)
-    logger.info(f"FINAL RESPONSE GENERATION STARTED - Agent: {agent_name}")
-    logger.info(f"Timestamp: {datetime.now().isoformat()}")
-    logger.info("-" * 80)
-    
-    # Get agent configuration
-    agent = get_agent_by_name(agent_name)
-    
-    logger.info(f"User Query: {user_query}")
-    logger.info(f"System Prompt: {agent['system_prompt'][:200]}...")
-    
-    # Initialize OpenAI client with agent's API key
-    client = OpenAI(api_key=agent["api_key"])
-    
-    # Build the prompt for final response
-    system_prompt = f"""You are a helpful assistant. {agent['system_prompt']}
+    if isinstance(value, list):
+        return truncated(value, max_items)
+    if isinstance(value, dict):
+        return {
+            key: truncated(item, max_items) if isinstance(item, list) else item
+            for key, item in value.items()
+        }
+    return value
+
+
+def get_final_system_prompt(agent: Dict[str, Any]) -> str:
+    """Return the final-response system prompt for agent, cached per agent version"""
+    key = prompt_cache_key(agent)
+    system_prompt = _final_system_prompts.get(key)
+    if system_prompt is None:
+        system_prompt = f"""You are a helpful assistant. {agent['system_prompt']}
 
 Your task:
 1. Analyze the API results provided
@@ -61,9 +71,24 @@ Your task:
 3. Use the context from the endpoint information: {agent['endpoint_info']}
 4. Provide a clear, helpful response that directly addresses the user's question
 5. If the API results don't contain relevant information, say so clearly
-6. Format your response in a way that's easy to understand"""
+6. Format your response in a way that's easy to understand
+7. A list given as {{"items": [...], "total": N, "omitted": M}} was cut to its first items; when counting or listing, use the total and say that M results are not shown"""
+        _final_system_prompts[key] = system_prompt
+    return system_prompt
+
 
-    api_results_str = json.dumps(api_results, indent=2, ensure_ascii=False)
+def build_messages(
+    agent: Dict[str, Any],
+    user_query: str,
+    api_results: Any,
+    max_result_items: Optional[int] = None
+) -> List[Dict[str, str]]:
+    """Build the chat messages for the final response"""
+    system_prompt = get_final_system_prompt(agent)
+
+    # Trimmed, compact JSON keeps the prompt (and its token cost) bounded
+    api_results = shrink_results(api_results, max_result_items or MAX_RESULT_ITEMS)
+    api_results_str = orjson.dumps(api_results).decode()
     user_prompt = f"""User Query: {user_query}
 
 API Results:
@@ -71,50 +96,138 @@ API Results:
 
 Please provide a clear answer to the user's query based on the API results above."""
 
-    logger.info("-" * 80)
-    logger.info("SYSTEM PROMPT SENT TO OpenAI:")
-    logger.info(system_prompt[:500] + "..." if len(system_prompt) > 500 else system_prompt)
-    logger.info("-" * 80)
-    logger.info("USER PROMPT SENT TO OpenAI:")
-    logger.info(f"User Query: {user_query}")
-    logger.info(f"API Results Length: {len(api_results_str)} characters")
-    if len(api_results_str) > 1000:
-        logger.info("API Results (first 1000 chars):")
-        logger.info(api_results_str[:1000] + "...")
-    else:
-        logger.info("API Results:")
-        logger.info(api_results_str)
-    logger.info("-" * 80)
+    logger.info("API Results Length: %s characters", len(api_results_str))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(_DASH80)
+        logger.debug("SYSTEM PROMPT SENT TO OpenAI:")
+        logger.debug("%.500s", system_prompt)
+        logger.debug(_DASH80)
+        logger.debug("USER PROMPT SENT TO OpenAI:")
+        logger.debug("User Query: %s", user_query)
+        if len(api_results_str) > 1000:
+            logger.debug("API Results (first 1000 chars):")
+            logger.debug("%.1000s...", api_results_str)
+        else:
+            logger.debug("API Results:")
+            logger.debug(api_results_str)
+        logger.debug(_DASH80)
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+async def generate_final_response(
+    agent_name: str,
+    user_query: str,
+    api_results: Any,
+    agent: Optional[Dict[str, Any]] = None,
+    max_result_items: Optional[int] = None
+) -> str:
+    """
+    Generate final response using OpenAI with API results
+    
+    Args:
+        agent_name: Name of the agent
+        user_query: Original user query
+        api_results: Results from the API query
+        agent: Agent configuration, if the caller already has it
+        max_result_items: Records kept from the top-level results (default MAX_RESULT_ITEMS)
+        
+    Returns:
+        Final response string
+    """
+    logger.info(_EQ80)
+    logger.info("FINAL RESPONSE GENERATION STARTED - Agent: %s", agent_name)
+    logger.info(_DASH80)
+    
+    # Get agent configuration (cached)
+    if agent is None:
+        agent = await get_agent_by_name(agent_name)
+    
+    logger.info("User Query: %s", user_query)
+    logger.debug("System Prompt: %.200s...", agent['system_prompt'])
+    
+    # Shared async OpenAI client for the agent's API key
+    client = get_openai_client(agent["api_key"])
+    
+    messages = build_messages(agent, user_query, api_results, max_result_items)
 
     try:
         logger.info("Calling OpenAI API for final response generation...")
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+            messages=messages,
             temperature=0.7,
             max_tokens=2000
         )
         
         final_response = response.choices[0].message.content.strip()
         
-        logger.info(f"OpenAI Response Received:")
-        logger.info(f"  - Model: {response.model}")
-        logger.info(f"  - Usage: {response.usage.total_tokens} tokens")
-        logger.info(f"  - Prompt Tokens: {response.usage.prompt_tokens}")
-        logger.info(f"  - Completion Tokens: {response.usage.completion_tokens}")
-        logger.info("-" * 80)
-        logger.info("FINAL RESPONSE GENERATED:")
-        logger.info(final_response[:500] + "..." if len(final_response) > 500 else final_response)
-        logger.info("=" * 80)
+        logger.info("OpenAI Response Received:")
+        logger.info("  - Model: %s", response.model)
+        logger.info("  - Usage: %s tokens", response.usage.total_tokens)
+        logger.info("  - Prompt Tokens: %s", response.usage.prompt_tokens)
+        logger.info("  - Completion Tokens: %s", response.usage.completion_tokens)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(_DASH80)
+            logger.debug("FINAL RESPONSE GENERATED:")
+            logger.debug("%.500s", final_response)
+        logger.info(_EQ80)
         
         return final_response
         
     except Exception as e:
-        logger.error(f"Error generating final response: {str(e)}")
+        logger.error("Error generating final response: %s", e)
         raise Exception(f"Error generating final response: {str(e)}")
 
 
+async def stream_final_response(
+    agent_name: str,
+    user_query: str,
+    api_results: Any,
+    agent: Optional[Dict[str, Any]] = None,
+    max_result_items: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Generate the final response as a stream of text fragments
 
+    Tokens are buffered and yielded in small batches (up to 8 tokens, or
+    whatever arrived within 50ms) to keep per-event overhead low
+    """
+    logger.info(_EQ80)
+    logger.info("STREAMED FINAL RESPONSE GENERATION STARTED - Agent: %s", agent_name)
+    
+    if agent is None:
+        agent = await get_agent_by_name(agent_name)
+    client = get_openai_client(agent["api_key"])
+    messages = build_messages(agent, user_query, api_results, max_result_items)
+    
+    logger.info("Calling OpenAI API for streamed final response generation...")
+    stream = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.7,
+        max_tokens=2000,
+        stream=True
+    )
+    
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    flush_at = loop.time()
+    # Closes the upstream response (returning its connection to the pool)
+    # even when the client disconnects mid-stream
+    async with stream:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                buffer.append(chunk.choices[0].delta.content)
+            if buffer and (len(buffer) >= 8 or loop.time() >= flush_at):
+                yield "".join(buffer)
+                buffer.clear()
+                flush_at = loop.time() + 0.05
+    if buffer:
+        yield "".join(buffer)
+    
+    logger.info("STREAMED FINAL RESPONSE COMPLETED")
+    logger.info(_EQ80)
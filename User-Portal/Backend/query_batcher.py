@@ -0,0 +1,84 @@
+"""
+Query Batcher Module
+Coalesces concurrent queries to a batch-capable endpoint into a single request
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBatcher:
+    """
+    Collects queries for one endpoint for up to `max_wait_ms` (or until
+    `max_batch_size` are queued) and sends them with `send`, which POSTs
+    `{"batch": [...]}` and returns the decoded response.
+
+    The endpoint must answer with a list of results, or an object with a
+    `results` list, in the same order as the submitted queries. Batches are
+    sent concurrently, so a slow batch does not hold up the next one.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        endpoint: str,
+        max_batch_size: int = 16,
+        max_wait_ms: int = 50
+    ):
+        self.send = send
+        self.endpoint = endpoint
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        # Batches in flight; referenced here so they are not garbage collected
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def submit(self, query: Dict[str, Any]) -> Any:
+        """Queue a query and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self) -> None:
+        """Drain the queue in batches, sending each without waiting for the last; exits once the queue is empty"""
+        loop = asyncio.get_running_loop()
+        while not self.queue.empty():
+            batch = [self.queue.get_nowait()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        """Send one batch and resolve each caller's future"""
+        queries = [query for query, _ in batch]
+        logger.info("Sending batch of %s queries to %s", len(queries), self.endpoint)
+        try:
+            results = await self.send(queries)
+            if isinstance(results, dict):
+                results = results.get("results")
+            if not isinstance(results, list) or len(results) != len(queries):
+                raise Exception("Batch API response does not contain one result per query")
+        except Exception as e:
+            logger.error("Batch request failed: %s", e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -2,69 +2,37 @@
 Query Generator Module
 Handles generation of API queries using OpenAI based on agent configuration
 """
-from openai import OpenAI
-from database import collection
-from typing import Dict, Any
-import json
+import asyncio
+import hashlib
+from api_executor import api_kind, get_agent_by_name, get_agents_by_names
+from openai_client import get_openai_client
+import semantic_cache
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 import logging
-from datetime import datetime
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+import orjson
+from cachetools import LRUCache
+
 logger = logging.getLogger(__name__)
 
+# Log section separators
+_EQ80 = "=" * 80
+_DASH80 = "-" * 80
 
-def get_agent_by_name(agent_name: str) -> Dict[str, Any]:
-    """Retrieve agent configuration from database"""
-    agent = collection.find_one({"name": agent_name})
-    if not agent:
-        raise ValueError(f"Agent '{agent_name}' not found")
-    return agent
+__all__ = ["generate_query", "batch_generate_query", "get_system_prompt", "build_system_prompt", "prompt_cache_key"]
 
+# Query generations in progress, keyed by (agent_name, user_query), so
+# identical concurrent requests share a single OpenAI call
+_inflight: Dict[Tuple[str, str], asyncio.Task] = {}
 
-def generate_query(agent_name: str, user_query: str) -> Dict[str, Any]:
-    """
-    Generate an API query using OpenAI based on agent configuration and user query
-    
-    Args:
-        agent_name: Name of the agent to use
-        user_query: User's natural language query
-        
-    Returns:
-        Generated query dictionary ready to be sent to the endpoint
-    """
-    logger.info("=" * 80)
-    logger.info(f"QUERY GENERATION STARTED - Agent: {agent_name}")
-    logger.info(f"Timestamp: {datetime.now().isoformat()}")
-    logger.info("-" * 80)
-    
-    # Get agent configuration
-    agent = get_agent_by_name(agent_name)
-    endpoint = agent['endpoint']
-    example_query = agent.get('example_query', {})
-    
-    logger.info(f"Agent Configuration Retrieved:")
-    logger.info(f"  - Endpoint: {endpoint}")
-    logger.info(f"  - System Prompt: {agent['system_prompt'][:100]}...")
-    
-    # Detect query structure from example query
-    has_odata_structure = "entity_set" in example_query or "filter" in example_query
-    has_elasticsearch_structure = "query" in example_query and isinstance(example_query.get("query"), dict)
-    
-    # Check if endpoint is OData
-    is_odata = "/OData/" in endpoint or endpoint.endswith("/OData/v4/2.0") or endpoint.endswith("/OData/v4/2.0/")
-    
-    # Initialize OpenAI client with agent's API key
-    client = OpenAI(api_key=agent["api_key"])
-    
-    # Build API-specific context based on endpoint type
-    api_context = ""
-    if is_odata:
-        api_context = """
+# Built system prompts keyed by prompt_cache_key; a changed agent gets a new key
+_system_prompts: LRUCache = LRUCache(maxsize=256)
+
+# Agent fields the system prompt is built from
+_PROMPT_FIELDS = ("system_prompt", "endpoint_info", "endpoint", "example_query", "test_scenarios")
+
+
+# API-specific prompt context, by api_kind
+_ODATA_CTX = """
 IMPORTANT: This is an OData API endpoint.
 
 OData Query Structure:
@@ -95,8 +63,8 @@ CRITICAL INSTRUCTIONS FOR OData:
 5. Field names in OData are case-sensitive - match the example query exactly
 6. If the example query shows specific field names for dates or descriptions, use those exact names
 """
-    elif has_elasticsearch_structure:
-        api_context = """
+
+_ES_CTX = """
 IMPORTANT: This is an Elasticsearch-style API endpoint.
 
 Elasticsearch Query Structure:
@@ -122,8 +90,8 @@ CRITICAL INSTRUCTIONS FOR Elasticsearch:
 2. Match the nesting structure of the example query exactly
 3. Date formats should match the example query format
 """
-    else:
-        api_context = """
+
+_REST_CTX = """
 IMPORTANT: This is a REST API endpoint.
 
 REST API Query Structure:
@@ -137,18 +105,15 @@ CRITICAL INSTRUCTIONS:
 3. Adapt only the values to match what the user is asking for
 4. Do not add or remove fields unless the user explicitly requests data not covered by the example
 """
-    
-    # Build the prompt for query generation - adapt based on example query structure
-    system_prompt = f"""You are a query generation assistant. Your job is to convert user queries into API query structures.
 
-Agent Context:
-- System Prompt: {agent['system_prompt']}
-- Endpoint Info: {agent['endpoint_info']}
-- Endpoint URL: {endpoint}
-- Example Query: {json.dumps(example_query, indent=2)}
-- Test Scenarios: {agent['test_scenarios']}
-{api_context}
-CRITICAL INSTRUCTIONS:
+_API_CONTEXT_BY_KIND = {
+    "odata": _ODATA_CTX,
+    "elasticsearch": _ES_CTX,
+    "rest": _REST_CTX,
+}
+
+# Fixed instructions ending the static query-generation system prefix
+_QUERY_INSTRUCTIONS = """CRITICAL INSTRUCTIONS:
 1. The example query is your PRIMARY reference - it shows the EXACT format, field names, and structure this API expects
 2. Analyze the example query structure carefully and match it EXACTLY
 3. Use ONLY field names that appear in the example query - never invent or guess field names
@@ -168,65 +133,237 @@ Your task:
 
 The query should retrieve data that helps answer the user's question while strictly following the example query format."""
 
+# Leading system message for each api_kind. It comes first and is
+# byte-identical for every agent of that kind, so OpenAI can reuse the
+# cached prompt prefix; agent-specific context follows in a second message
+_STATIC_SYSTEM_PREFIX = {
+    kind: f"""You are a query generation assistant. Your job is to convert user queries into API query structures.
+{api_context}
+{_QUERY_INSTRUCTIONS}"""
+    for kind, api_context in _API_CONTEXT_BY_KIND.items()
+}
+
+
+def canonical_json(value: Any) -> str:
+    """Indented JSON with sorted keys, so equal values always serialize to the same text"""
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode()
+
+
+def prompt_cache_key(agent: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Key identifying an agent's prompt-relevant configuration: its _etag
+    version tag (set by the Admin API on every write), or a content hash
+    for documents written without one
+    """
+    version = agent.get("_etag")
+    if version is None:
+        fields = {field: agent.get(field) for field in _PROMPT_FIELDS}
+        version = hashlib.blake2b(orjson.dumps(fields, default=str, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+    return str(agent.get("_id")), version
+
+
+def get_system_prompt(agent: Dict[str, Any]) -> str:
+    """Return the agent's query-generation context message, building it once per configuration"""
+    key = prompt_cache_key(agent)
+    system_prompt = _system_prompts.get(key)
+    if system_prompt is None:
+        system_prompt = build_system_prompt(agent)
+        _system_prompts[key] = system_prompt
+    return system_prompt
+
+
+def build_system_prompt(agent: Dict[str, Any]) -> str:
+    """
+    Build the agent-specific system message for query generation; it
+    follows the static prefix from _STATIC_SYSTEM_PREFIX
+    """
+    example_query = agent.get('example_query', {})
+    
+    return f"""Agent Context:
+- System Prompt: {agent['system_prompt']}
+- Endpoint Info: {agent['endpoint_info']}
+- Endpoint URL: {agent['endpoint']}
+- Example Query: {canonical_json(example_query)}
+- Test Scenarios: {agent['test_scenarios']}"""
+
+
+async def generate_query(agent_name: str, user_query: str, agent: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Generate an API query using OpenAI based on agent configuration and user query
+    
+    Args:
+        agent_name: Name of the agent to use
+        user_query: User's natural language query
+        agent: Agent configuration, if the caller already has it
+        
+    Returns:
+        Generated query dictionary ready to be sent to the endpoint.
+        Concurrent callers with the same agent and query share the result,
+        so it must not be modified.
+    """
+    key = (agent_name, user_query)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_generate_query(agent_name, user_query, agent))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        logger.info("Joining in-flight query generation - Agent: %s", agent_name)
+    # Shielded so one caller disconnecting does not cancel the call for the others
+    return await asyncio.shield(task)
+
+
+async def _read_json_object(stream: AsyncIterator[Any]) -> str:
+    """
+    Read streamed completion chunks until the top-level JSON object closes
+    and return its text; braces inside string literals are not counted
+    """
+    parts: List[str] = []
+    depth = 0
+    in_string = escaped = False
+    async for chunk in stream:
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        if not text:
+            continue
+        for i, char in enumerate(text):
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    parts.append(text[:i + 1])
+                    return "".join(parts)
+        parts.append(text)
+    return "".join(parts)
+
+
+async def batch_generate_query(items: List[Tuple[str, str]]) -> List[Any]:
+    """
+    Generate queries for several user queries concurrently
+    
+    Args:
+        items: (agent_name, user_query) pairs
+        
+    Returns:
+        One entry per item, in order: the generated query, or the
+        exception raised for that item
+    """
+    agents = await get_agents_by_names([agent_name for agent_name, _ in items])
+
+    async def run(agent_name: str, user_query: str) -> Dict[str, Any]:
+        agent = agents.get(agent_name)
+        if agent is None:
+            raise ValueError(f"Agent '{agent_name}' not found")
+        return await generate_query(agent_name, user_query, agent=agent)
+
+    return await asyncio.gather(*(run(agent_name, user_query) for agent_name, user_query in items), return_exceptions=True)
+
+
+async def _generate_query(agent_name: str, user_query: str, agent: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Generate the query with a single OpenAI call"""
+    logger.info(_EQ80)
+    logger.info("QUERY GENERATION STARTED - Agent: %s", agent_name)
+    logger.info(_DASH80)
+    
+    # Get agent configuration (cached). The dict is shared with the agent
+    # cache, so fields are read, never popped or modified
+    if agent is None:
+        agent = await get_agent_by_name(agent_name)
+    
+    logger.info("Agent Configuration Retrieved:")
+    logger.info("  - Endpoint: %s", agent['endpoint'])
+    logger.debug("  - System Prompt: %.100s...", agent['system_prompt'])
+    
+    # Shared async OpenAI client for the agent's API key
+    client = get_openai_client(agent["api_key"])
+    
+    # Reuse the query generated for a near-duplicate question, if any
+    index_key = vector = None
+    if semantic_cache.enabled():
+        index_key = prompt_cache_key(agent)
+        try:
+            vector = await semantic_cache.embed(client, user_query)
+            cached_query = await semantic_cache.lookup(index_key, vector)
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed: %s", e)
+            cached_query = None
+        if cached_query is not None:
+            logger.info("Semantic cache hit - Agent: %s", agent_name)
+            return cached_query
+    
+    # Static prefix for the endpoint type (classified once when the agent was
+    # loaded), then the agent context, which depends only on the agent (memoized)
+    static_prefix = _STATIC_SYSTEM_PREFIX[agent.get("_api_kind") or api_kind(agent)]
+    system_prompt = get_system_prompt(agent)
+
     user_prompt = f"""User Query: {user_query}
 
 Generate an API query JSON structure based on the example query format. Return only the JSON, no other text."""
 
-    logger.info(f"User Query: {user_query}")
-    logger.info("-" * 80)
-    logger.info("SYSTEM PROMPT SENT TO OpenAI:")
-    logger.info(system_prompt[:500] + "..." if len(system_prompt) > 500 else system_prompt)
-    logger.info("-" * 80)
-    logger.info("USER PROMPT SENT TO OpenAI:")
-    logger.info(user_prompt)
-    logger.info("-" * 80)
+    logger.info("User Query: %s", user_query)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(_DASH80)
+        logger.debug("SYSTEM PROMPT SENT TO OpenAI:")
+        logger.debug("%.500s", system_prompt)
+        logger.debug(_DASH80)
+        logger.debug("USER PROMPT SENT TO OpenAI:")
+        logger.debug(user_prompt)
+        logger.debug(_DASH80)
 
     try:
         logger.info("Calling OpenAI API for query generation...")
-        response = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
+                {"role": "system", "content": static_prefix},
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
+            # JSON mode returns a bare JSON object; generated queries are short
+            response_format={"type": "json_object"},
             temperature=0.3,
-            max_tokens=1000
+            max_tokens=300,
+            stream=True
         )
         
-        logger.info(f"OpenAI Response Received:")
-        logger.info(f"  - Model: {response.model}")
-        logger.info(f"  - Usage: {response.usage.total_tokens} tokens")
+        # Stop reading (and close the stream) as soon as the object is complete
+        async with stream:
+            generated_text = await _read_json_object(stream)
         
-        # Extract the generated query
-        generated_text = response.choices[0].message.content.strip()
-        logger.info("Raw Generated Text:")
-        logger.info(generated_text[:500] + "..." if len(generated_text) > 500 else generated_text)
-        
-        # Remove markdown code blocks if present
-        if generated_text.startswith("```json"):
-            generated_text = generated_text[7:]
-        if generated_text.startswith("```"):
-            generated_text = generated_text[3:]
-        if generated_text.endswith("```"):
-            generated_text = generated_text[:-3]
-        generated_text = generated_text.strip()
+        logger.info("OpenAI Response Received: %s characters", len(generated_text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw Generated Text:")
+            logger.debug("%.500s", generated_text)
         
         # Parse JSON
-        generated_query = json.loads(generated_text)
+        generated_query = orjson.loads(generated_text)
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(_DASH80)
+            logger.debug("GENERATED QUERY (Parsed JSON):")
+            logger.debug(orjson.dumps(generated_query, option=orjson.OPT_INDENT_2).decode())
+        logger.info(_EQ80)
         
-        logger.info("-" * 80)
-        logger.info("GENERATED QUERY (Parsed JSON):")
-        logger.info(json.dumps(generated_query, indent=2, ensure_ascii=False))
-        logger.info("=" * 80)
+        if vector is not None:
+            await semantic_cache.store(index_key, vector, generated_query)
         
         return generated_query
         
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON Parse Error: {str(e)}")
-        logger.error(f"Failed to parse text: {generated_text}")
+    except orjson.JSONDecodeError as e:
+        logger.error("JSON Parse Error: %s", e)
+        logger.error("Failed to parse text: %s", generated_text)
         raise ValueError(f"Failed to parse generated query as JSON: {str(e)}")
     except Exception as e:
-        logger.error(f"Error generating query: {str(e)}")
+        logger.error("Error generating query: %s", e)
         raise Exception(f"Error generating query: {str(e)}")
 
 
@@ -0,0 +1,103 @@
+"""
+Semantic cache for generated queries
+A user query whose embedding is close enough to an earlier one for the same
+agent version reuses that query's generated JSON instead of calling the
+model again. Disabled unless SEMANTIC_CACHE_THRESHOLD is set
+"""
+import math
+import operator
+import os
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from cachetools import LRUCache
+from openai import AsyncOpenAI
+from redis.exceptions import RedisError
+
+import cache
+
+# Minimum cosine similarity for a hit (e.g. 0.92); 0 disables the cache
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0))
+SEMANTIC_CACHE_TTL = int(os.environ.get("SEMANTIC_CACHE_TTL", 86400))
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Shortened embeddings keep the similarity scan cheap in pure Python
+EMBEDDING_DIMENSIONS = 256
+# Entries kept per agent version; the oldest is dropped first
+MAX_ENTRIES = 256
+
+# (unit-length embedding, generated query)
+Entry = Tuple[array, Dict[str, Any]]
+
+# Per-worker indexes by (agent id, agent version), loaded from Redis on first use.
+# Redis keeps a capped list (newest first) per agent version.
+_indexes: LRUCache = LRUCache(maxsize=256)
+
+
+def enabled() -> bool:
+    return SEMANTIC_CACHE_THRESHOLD > 0
+
+
+def redis_key(index_key: Tuple[str, str]) -> str:
+    return f"semcache:entries:{index_key[0]}:{index_key[1]}"
+
+
+async def embed(client: AsyncOpenAI, text: str) -> array:
+    """Embed text as a unit-length vector, so a dot product is the cosine similarity"""
+    response = await client.embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=text,
+        dimensions=EMBEDDING_DIMENSIONS
+    )
+    vector = response.data[0].embedding
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return array("f", [x / norm for x in vector])
+
+
+async def _get_index(index_key: Tuple[str, str]) -> List[Entry]:
+    """Return the worker's index for an agent version, loading it from Redis on a miss"""
+    index = _indexes.get(index_key)
+    if index is None:
+        index = []
+        if cache.redis is not None:
+            try:
+                stored = await cache.redis.lrange(redis_key(index_key), 0, MAX_ENTRIES - 1)
+            except RedisError:
+                stored = []
+            # The Redis list is newest first; the index is oldest first
+            for value in reversed(stored):
+                entry = orjson.loads(value)
+                index.append((array("f", entry["vector"]), entry["query"]))
+        _indexes[index_key] = index
+    return index
+
+
+async def lookup(index_key: Tuple[str, str], vector: array) -> Optional[Dict[str, Any]]:
+    """Return the generated query of the most similar entry above the threshold, or None"""
+    best, best_score = None, SEMANTIC_CACHE_THRESHOLD
+    for stored, generated_query in await _get_index(index_key):
+        score = sum(map(operator.mul, stored, vector))
+        if score >= best_score:
+            best, best_score = generated_query, score
+    return best
+
+
+async def store(index_key: Tuple[str, str], vector: array, generated_query: Dict[str, Any]) -> None:
+    """Add a generated query to the worker's index and to Redis, keeping the newest MAX_ENTRIES"""
+    index = await _get_index(index_key)
+    index.append((vector, generated_query))
+    if len(index) > MAX_ENTRIES:
+        del index[0]
+
+    if cache.redis is None:
+        return
+    name = redis_key(index_key)
+    try:
+        async with cache.redis.pipeline(transaction=False) as pipe:
+            pipe.lpush(name, orjson.dumps({"vector": vector.tolist(), "query": generated_query}))
+            pipe.ltrim(name, 0, MAX_ENTRIES - 1)
+            pipe.expire(name, SEMANTIC_CACHE_TTL)
+            await pipe.execute()
+    except RedisError:
+        pass
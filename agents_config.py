@@ -0,0 +1,55 @@
+"""
+Agent definitions seeded into MongoDB by mongo.py
+"""
+import os
+from datetime import datetime, timezone
+
+# Agent configuration - Simple and scalable structure
+motie_checker = {
+    "name": "MotieChecker",
+    "api_key": os.environ.get("MOTIECHECKER_OPENAI_KEY", ""),
+    "system_prompt": (
+            "You are a political analyst specializing in Dutch parliamentary voting behavior. "
+            "Your job is to help young people understand how political parties vote on key issues "
+            "like housing, climate, and education. Summarize votes in clear language, explain what "
+            "they mean for young people, and list which parties voted for or against — without "
+            "using technical jargon."
+    ),
+    "endpoint": "https://gegevensmagazijn.tweedekamer.nl/OData/v4/2.0/",
+    "endpoint_info": "Tweede Kamer OData API - Provides access to Dutch parliamentary voting data (Stemming) and decisions (Besluit). Use Besluit entity for text searches via BesluitTekst field.",
+    "example_query": {
+        "entity_set": "Besluit",
+        "filter": "contains(BesluitTekst,'studenten') and ApiGewijzigdOp ge 2019-01-01T00:00:00Z and ApiGewijzigdOp le 2019-12-31T23:59:59Z",
+        "top": 10,
+        "select": "Id,BesluitTekst,ApiGewijzigdOp,BesluitSoort"
+    },
+    "test_scenarios": (
+        "User prompt: 'What did parties vote on student housing in 2019?'\n\n"
+        "Expected AI response:\n"
+        "In 2019, the Dutch Parliament discussed several motions and decisions related to student housing. "
+        "For example, there were discussions about allocating more funding for student housing and addressing "
+        "the shortage of affordable housing for students. The votes typically showed left-leaning parties "
+        "(like GroenLinks, PvdA, SP) supporting more government intervention and funding, while right-wing "
+        "parties (like VVD, CDA) were more cautious about increasing public spending.\n\n"
+        "Note: Search for 'studenten' or 'studentenhuisvesting' in BesluitTekst field. "
+        "Use ApiGewijzigdOp for date filtering (not Datum). "
+        "Available fields in Besluit: Id, BesluitTekst, ApiGewijzigdOp, BesluitSoort, Status, Opmerking."
+    ),
+    "created_at": datetime.now(timezone.utc),
+}
+
+
+# Every agent upserted by mongo.py. Add more agents here as needed, e.g.:
+# another_agent = {
+#     "name": "AnotherAgent",
+#     "api_key": "...",
+#     "system_prompt": "...",
+#     "endpoint": "...",
+#     "endpoint_info": "...",
+#     "example_query": {...},
+#     "test_scenarios": "...",
+#     "created_at": datetime.now(timezone.utc),
+# }
+AGENTS = [
+    motie_checker,
+]